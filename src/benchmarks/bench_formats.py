@@ -0,0 +1,80 @@
+"""
+Compare the resize_data output formats on encode time, decode time and size.
+
+Every candidate encodes the same 224x224 crops produced by the current resize
+path and decodes them back to a uint8 array. By default the crops come from
+synthetic radiograph-like images; pass --input-dir to use real images such
+as ./data/raw_dataset/train/normal.
+
+Run from the src/ directory:
+    python -m benchmarks.bench_formats
+"""
+
+import argparse
+import io
+import time
+import numpy as np
+from PIL import Image
+from benchmarks.bench_resize import load_jpegs, synthetic_jpegs
+from utils.formats import parse_output_format, save_image
+from utils.resize import resize_and_crop
+
+FORMATS = [
+    "jpeg",
+    "jpeg,gray",
+    "jpeg,gray,q90",
+    "jpeg,gray,q95",
+    "png,gray",
+    "webp,gray",
+    "npy,gray",
+]
+
+
+def encode(img: Image.Image, spec: str) -> bytes:
+    buffer = io.BytesIO()
+    save_image(img, buffer, parse_output_format(spec))
+    return buffer.getvalue()
+
+
+def decode(data: bytes, spec: str) -> np.ndarray:
+    if spec.startswith("npy"):
+        return np.load(io.BytesIO(data))
+    with Image.open(io.BytesIO(data)) as img:
+        return np.asarray(img)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--input-dir", default=None)
+    parser.add_argument("--images", type=int, default=50)
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--rgb", action="store_true", help="Resize in RGB mode.")
+    args = parser.parse_args()
+
+    if args.input_dir:
+        sources = load_jpegs(args.input_dir, args.images)
+    else:
+        sources = synthetic_jpegs(args.images, args.size)
+
+    crops = []
+    for data in sources:
+        with Image.open(io.BytesIO(data)) as img:
+            crops.append(resize_and_crop(img.convert("RGB" if args.rgb else "L")))
+
+    print(f"{'format':<16}{'encode ms':>10}{'decode ms':>10}{'KiB/image':>11}")
+    for spec in FORMATS:
+        start = time.perf_counter()
+        encoded = [encode(crop, spec) for crop in crops]
+        encode_ms = (time.perf_counter() - start) / len(crops) * 1000
+
+        start = time.perf_counter()
+        for data in encoded:
+            decode(data, spec)
+        decode_ms = (time.perf_counter() - start) / len(crops) * 1000
+
+        size_kib = sum(len(data) for data in encoded) / len(encoded) / 1024
+        print(f"{spec:<16}{encode_ms:>10.3f}{decode_ms:>10.3f}{size_kib:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Benchmark and validate the draft-mode fast resize against the current path.
+
+Both paths decode, resize and crop every JPEG in memory. The fast outputs are
+compared with the current ones using PSNR and SSIM. The script exits with
+status 1 if any image falls below the tolerances. By default it runs on
+synthetic 2048x2048 radiograph-like JPEGs; pass --input-dir to use real
+images such as ./data/raw_dataset/train/normal.
+
+Run from the src/ directory:
+    python -m benchmarks.bench_resize
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+import numpy as np
+from PIL import Image
+from skimage.metrics import peak_signal_noise_ratio, structural_similarity
+from utils.resize import resize_and_crop
+
+
+def synthetic_jpegs(count: int, size: int) -> list[bytes]:
+    """
+    Encode smooth, noisy grayscale images similar in content to chest X-rays.
+    """
+    rng = np.random.default_rng(913)
+    y, x = np.mgrid[-1 : 1 : size * 1j, -1 : 1 : size * 1j]
+    images = []
+    for _ in range(count):
+        cx, cy = rng.uniform(-0.3, 0.3, 2)
+        body = np.exp(-((x - cx) ** 2 + (y - cy) ** 2) * rng.uniform(1, 3))
+        ribs = 0.15 * np.sin(y * rng.uniform(20, 40)) * (np.abs(x) < 0.7)
+        noise = rng.normal(0, 0.03, (size, size))
+        pixels = np.clip((body + ribs + noise) * 200, 0, 255).astype(np.uint8)
+
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, "JPEG", quality=95)
+        images.append(buffer.getvalue())
+    return images
+
+
+def load_jpegs(input_dir: str, limit: int) -> list[bytes]:
+    files = sorted(
+        file
+        for file in os.listdir(input_dir)
+        if file.lower().endswith((".jpeg", ".jpg"))
+    )
+    images = []
+    for file in files[:limit]:
+        with open(os.path.join(input_dir, file), "rb") as f:
+            images.append(f.read())
+    return images
+
+
+def run(images: list[bytes], fast: bool) -> tuple[float, list[np.ndarray]]:
+    """
+    Resize every image, returning the milliseconds per image and the outputs.
+    """
+    outputs = []
+    start = time.perf_counter()
+    for data in images:
+        with Image.open(io.BytesIO(data)) as img:
+            outputs.append(np.asarray(resize_and_crop(img, fast=fast)))
+    elapsed = time.perf_counter() - start
+    return elapsed / len(images) * 1000, outputs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--input-dir", default=None)
+    parser.add_argument("--images", type=int, default=20)
+    parser.add_argument("--size", type=int, default=2048)
+    parser.add_argument("--min-psnr", type=float, default=35.0)
+    parser.add_argument("--min-ssim", type=float, default=0.95)
+    args = parser.parse_args()
+
+    if args.input_dir:
+        images = load_jpegs(args.input_dir, args.images)
+    else:
+        images = synthetic_jpegs(args.images, args.size)
+
+    legacy_ms, legacy = run(images, fast=False)
+    fast_ms, fast = run(images, fast=True)
+
+    psnr = []
+    ssim = []
+    for reference, candidate in zip(legacy, fast):
+        psnr.append(peak_signal_noise_ratio(reference, candidate, data_range=255))
+        ssim.append(
+            structural_similarity(
+                reference,
+                candidate,
+                data_range=255,
+                channel_axis=2 if reference.ndim == 3 else None,
+            )
+        )
+
+    print(f"{'path':<12}{'ms/image':>10}")
+    print(f"{'legacy':<12}{legacy_ms:>10.2f}")
+    print(f"{'fast':<12}{fast_ms:>10.2f}")
+    print(f"Speedup: {legacy_ms / fast_ms:.2f}x")
+    print(f"PSNR min/mean: {min(psnr):.2f}/{np.mean(psnr):.2f} dB")
+    print(f"SSIM min/mean: {min(ssim):.4f}/{np.mean(ssim):.4f}")
+
+    if min(psnr) < args.min_psnr or min(ssim) < args.min_ssim:
+        print(f"FAIL: below tolerance (PSNR {args.min_psnr}, SSIM {args.min_ssim})")
+        sys.exit(1)
+    print("OK: fast resize within tolerance")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Check that both RSNA split paths select the same patients for a seed.
+
+The default pipeline renames each class directory with sort_and_rename_files
+and then calls move_random_files for train and test. The --select-first and
+streaming pipelines call plan_rsna_split up front. This script runs the
+real file functions on empty placeholder images in a temporary directory,
+maps the moved files back to patient IDs and compares them with the plan.
+It exits with status 1 on any difference.
+
+Run from the src/ directory:
+    python -m benchmarks.check_split
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import uuid
+import numpy as np
+from utils.files import move_random_files, sort_and_rename_files
+from utils.split import CLASS_NAMES, plan_rsna_split
+
+
+def synthetic_labels(count: int, pneumonia_fraction: float) -> dict[str, int]:
+    rng = np.random.default_rng(913)
+    return {
+        str(uuid.UUID(bytes=rng.bytes(16), version=4)): int(
+            rng.random() < pneumonia_fraction
+        )
+        for _ in range(count)
+    }
+
+
+def move_random_split(
+    labels: dict[str, int], seed: int, train_count: int, test_count: int
+) -> dict[str, tuple[str, str]]:
+    """
+    Replay move_rsna_files_to_raw_dataset on placeholder files.
+
+    Returns:
+        dict: Mapping of selected patient ID to (split, class name).
+    """
+    selected = {}
+    with tempfile.TemporaryDirectory() as root:
+        for target, class_name in CLASS_NAMES.items():
+            renamed = os.path.join(root, "renamed", class_name)
+            os.makedirs(renamed)
+            patients = [pid for pid, label in labels.items() if label == target]
+            for patient_id in patients:
+                open(os.path.join(renamed, f"{patient_id}.jpeg"), "w").close()
+
+            # sort_and_rename_files names the i-th file in sorted order NNNN.jpeg
+            original = sorted(f"{pid}.jpeg" for pid in patients)
+            sort_and_rename_files(renamed)
+
+            for split, count in (("train", train_count), ("test", test_count)):
+                dest_dir = os.path.join(root, split, class_name)
+                for _, dest_file in move_random_files(renamed, dest_dir, count, seed):
+                    index = int(os.path.splitext(os.path.basename(dest_file))[0])
+                    patient_id = os.path.splitext(original[index - 1])[0]
+                    selected[patient_id] = (split, class_name)
+    return selected
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Compare the planned RSNA split with the move_random_files one."
+    )
+    parser.add_argument("--patients", type=int, default=2000)
+    parser.add_argument("--pneumonia-fraction", type=float, default=0.25)
+    parser.add_argument("--train-count", type=int, default=100)
+    parser.add_argument("--test-count", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=913)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    labels = synthetic_labels(args.patients, args.pneumonia_fraction)
+
+    plan = {
+        patient_id: (split, class_name)
+        for patient_id, (split, class_name, _) in plan_rsna_split(
+            labels, args.seed, args.train_count, args.test_count
+        ).items()
+    }
+    moved = move_random_split(labels, args.seed, args.train_count, args.test_count)
+
+    differing = set(plan.items()) ^ set(moved.items())
+    print(f"Planned {len(plan)} patients, moved {len(moved)}")
+    if differing:
+        print(f"FAIL: {len(differing)} (patient, split) pairs differ")
+        sys.exit(1)
+    print("OK: both paths select the same split")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,165 @@
+import argparse
+import json
 import os
-import kaggle
+import shutil
 import zipfile
 
-# Ensure the data directory exists
-os.makedirs("data", exist_ok=True)
+DATA_PATH = "./data"
 
 competition_dataset = "rsna-pneumonia-detection-challenge"
 regular_dataset = "paultimothymooney/chest-xray-pneumonia"
 
 
-def unzip_file(zip_path, extract_to):
+def get_kaggle_api():
+    # Importing kaggle authenticates immediately, so defer it until needed
+    import kaggle
+
+    return kaggle.api
+
+
+def load_checkpoint(checkpoint_path: str) -> set[str]:
+    if not os.path.exists(checkpoint_path):
+        return set()
+    with open(checkpoint_path, "r") as f:
+        return set(json.load(f))
+
+
+def save_checkpoint(checkpoint_path: str, done: set[str]) -> None:
+    # Write then rename, so an interrupted save never corrupts the checkpoint
+    with open(checkpoint_path + ".tmp", "w") as f:
+        json.dump(sorted(done), f)
+    os.replace(checkpoint_path + ".tmp", checkpoint_path)
+
+
+def unzip_file(
+    zip_path,
+    extract_to,
+    skip_suffixes: tuple[str, ...] = (),
+    delete_zip: bool = True,
+    checkpoint_every: int = 500,
+):
+    """
+    Extract a zip archive member by member, resuming after interruptions.
+
+    Completed members are recorded in a checkpoint next to the archive and
+    skipped on the next run. Each member is written to a temporary file and
+    renamed into place, so a crash never leaves a truncated file behind.
+
+    Args:
+        zip_path (str): Path to the zip archive.
+        extract_to (str): Directory to extract into.
+        skip_suffixes (tuple): Members ending with any of these (e.g. ".dcm")
+            are left inside the archive.
+        delete_zip (bool): Remove the archive and checkpoint once done.
+        checkpoint_every (int): Number of members between checkpoint saves.
+    """
+    checkpoint_path = zip_path + ".progress.json"
+    done = load_checkpoint(checkpoint_path)
+    root = os.path.realpath(extract_to)
+    extracted = 0
+
     with zipfile.ZipFile(zip_path, "r") as zip_ref:
-        zip_ref.extractall(extract_to)
-    os.remove(zip_path)
+        for info in zip_ref.infolist():
+            if info.filename in done or info.filename.lower().endswith(skip_suffixes):
+                continue
+
+            target = os.path.realpath(os.path.join(extract_to, info.filename))
+            if not target.startswith(root + os.sep):
+                raise ValueError(f"Refusing to extract {info.filename} outside {root}")
+
+            if info.is_dir():
+                os.makedirs(target, exist_ok=True)
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with zip_ref.open(info) as src, open(target + ".part", "wb") as dst:
+                    shutil.copyfileobj(src, dst, 1 << 20)
+                os.replace(target + ".part", target)
+
+            done.add(info.filename)
+            extracted += 1
+            if extracted % checkpoint_every == 0:
+                save_checkpoint(checkpoint_path, done)
+
+    save_checkpoint(checkpoint_path, done)
+    print(f"Extracted {extracted} members from {zip_path} ({len(done)} total)")
 
+    if delete_zip:
+        os.remove(zip_path)
+        os.remove(checkpoint_path)
+
+
+def download_and_unzip_dataset(
+    dataset, is_competition=False, api=None, keep_dicoms_zipped=False
+):
+    """
+    Download a Kaggle dataset and extract it into the data folder.
+
+    The download is skipped while an archive from an earlier run is still
+    present, so an interrupted extraction resumes where it stopped.
+
+    Args:
+        dataset (str): Competition name or dataset reference.
+        is_competition (bool): Whether dataset is a competition.
+        api (optional): Kaggle API client; defaults to kaggle.api.
+        keep_dicoms_zipped (bool): Leave .dcm members in the archive, to be
+            read in place by get_raw_data.py --from-zip.
+    """
+    if is_competition:
+        zip_file = f"{DATA_PATH}/{dataset}.zip"
+    else:
+        zip_file = f"{DATA_PATH}/{dataset.split('/')[-1]}.zip"
 
-def download_and_unzip_dataset(dataset, is_competition=False):
     try:
-        print(f"Downloading dataset {dataset}...")
-        if is_competition:
-            kaggle.api.competition_download_files(dataset, path="./data")
-            zip_file = f"./data/{dataset}.zip"
+        if os.path.exists(zip_file + ".progress.json"):
+            print(f"Resuming extraction of {zip_file}...")
         else:
-            kaggle.api.dataset_download_files(dataset, path="./data")
-            zip_file = f"./data/{dataset.split('/')[-1]}.zip"
+            api = api or get_kaggle_api()
+            print(f"Downloading dataset {dataset}...")
+            # Without force, Kaggle skips archives that are already up to date
+            if is_competition:
+                api.competition_download_files(dataset, path=DATA_PATH, force=False)
+            else:
+                api.dataset_download_files(dataset, path=DATA_PATH, force=False)
 
-        unzip_file(zip_file, "./data")
+        if keep_dicoms_zipped:
+            unzip_file(zip_file, DATA_PATH, skip_suffixes=(".dcm",), delete_zip=False)
+        else:
+            unzip_file(zip_file, DATA_PATH)
 
         print(
             f"Dataset {dataset} downloaded and unzipped in data/ folder successfully."
         )
-    except kaggle.rest.ApiException as e:
-        print(f"Failed to download dataset {dataset}: {e}")
     except FileNotFoundError as e:
         print(f"File not found error: {e}")
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+        print(f"Failed to download dataset {dataset}: {e}")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Download the Kaggle datasets.")
+    parser.add_argument(
+        "--keep-dicoms-zipped",
+        action="store_true",
+        help="Leave the RSNA DICOMs inside the zip instead of extracting them.",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+
+    # Ensure the data directory exists
+    os.makedirs(DATA_PATH, exist_ok=True)
+
+    download_and_unzip_dataset(
+        competition_dataset,
+        is_competition=True,
+        keep_dicoms_zipped=args.keep_dicoms_zipped,
+    )
+    download_and_unzip_dataset(regular_dataset)
 
+    print("All datasets downloaded and unzipped in the data/ folder successfully.")
 
-download_and_unzip_dataset(competition_dataset, is_competition=True)
-download_and_unzip_dataset(regular_dataset)
 
-print("All datasets downloaded and unzipped in the data/ folder successfully.")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+import argparse
+import copy
+import inspect
+import json
+import os
+import time
+import numpy as np
+import torch
+from torch.ao.quantization import get_default_qconfig_mapping, quantize_dynamic
+from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+from torch.utils.data import DataLoader, Subset
+from loader import SEED, load_split, make_loader
+from models import MODELS, load_model
+from utils.split import CLASS_NAMES
+
+EXPORT_PATH = "./models/exported"
+IMAGE_SIZE = 224
+
+# Quantized kernels for x86 CPUs (fbgemm with AVX2/AVX-512 when available)
+QUANTIZED_ENGINE = "x86"
+
+
+def example_inputs(batch_size: int = 1) -> tuple[torch.Tensor]:
+    return (torch.rand(batch_size, 3, IMAGE_SIZE, IMAGE_SIZE),)
+
+
+def to_torchscript(model: torch.nn.Module) -> torch.jit.ScriptModule:
+    """
+    Trace a model and freeze it, folding weights and batch norms into the graph.
+    """
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example_inputs())
+    return torch.jit.optimize_for_inference(torch.jit.freeze(traced.eval()))
+
+
+def quantize_dynamic_int8(model: torch.nn.Module) -> torch.nn.Module:
+    """
+    Quantize the weights of linear layers to int8, with activations quantized
+    on the fly. Needs no calibration, but leaves the convolutions in fp32, so
+    it mostly helps CNNModel, whose fc1 holds most of its weights.
+    """
+    return quantize_dynamic(copy.deepcopy(model), {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def quantize_static_int8(
+    model: torch.nn.Module, calibration_loader: DataLoader
+) -> torch.nn.Module:
+    """
+    Quantize weights and activations to int8 with FX graph mode quantization.
+
+    Observers inserted by prepare_fx record activation ranges while the
+    calibration images run through the model; convert_fx then fuses
+    conv/bn/relu and replaces them with int8 kernels.
+
+    Args:
+        model (torch.nn.Module): The fp32 model, in eval mode.
+        calibration_loader (DataLoader): Loader over calibration images.
+
+    Returns:
+        torch.nn.Module: The quantized model.
+    """
+    torch.backends.quantized.engine = QUANTIZED_ENGINE
+    qconfig_mapping = get_default_qconfig_mapping(QUANTIZED_ENGINE)
+    prepared = prepare_fx(copy.deepcopy(model), qconfig_mapping, example_inputs())
+
+    with torch.no_grad():
+        for images, _ in calibration_loader:
+            prepared(images)
+    return convert_fx(prepared)
+
+
+def export_onnx(model: torch.nn.Module, output_file: str) -> bool:
+    """
+    Export a model to ONNX with a dynamic batch dimension.
+
+    Returns:
+        bool: False when the onnx package is not installed.
+    """
+    try:
+        import onnx  # noqa: F401
+    except ImportError:
+        print("onnx is not installed, skipping the ONNX export")
+        return False
+
+    # Newer torch exports through dynamo by default; the pinned 2.3 has no
+    # such argument and only the TorchScript exporter
+    options = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        options["dynamo"] = False
+
+    torch.onnx.export(
+        model,
+        example_inputs(),
+        output_file,
+        input_names=["images"],
+        output_names=["logits"],
+        dynamic_axes={"images": {0: "batch"}, "logits": {0: "batch"}},
+        **options,
+    )
+    return True
+
+
+def onnx_predictor(onnx_file: str, threads: int):
+    """
+    Wrap an ONNX Runtime session as a callable taking and returning tensors.
+
+    Returns:
+        callable: The predictor, or None when onnxruntime is not installed.
+    """
+    try:
+        import onnxruntime
+    except ImportError:
+        print("onnxruntime is not installed, skipping the ONNX evaluation")
+        return None
+
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = threads
+    session = onnxruntime.InferenceSession(
+        onnx_file, options, providers=["CPUExecutionProvider"]
+    )
+
+    def predict(images: torch.Tensor) -> torch.Tensor:
+        (logits,) = session.run(None, {"images": images.numpy()})
+        return torch.from_numpy(logits)
+
+    return predict
+
+
+def evaluate(predict, loader: DataLoader) -> dict:
+    """
+    Run a model over a labelled loader, timing only the forward passes.
+
+    Args:
+        predict (callable): Maps a float batch to logits.
+        loader (DataLoader): Evaluation loader, not shuffled.
+
+    Returns:
+        dict: Predictions, accuracy, 2x2 confusion matrix (rows are true
+            classes) and milliseconds per image.
+    """
+    predictions = []
+    targets = []
+    elapsed = 0.0
+    with torch.inference_mode():
+        # The first calls run TorchScript's profiling passes and allocate
+        # buffers, which would otherwise be billed to the first batch
+        for _ in range(2):
+            predict(example_inputs(loader.batch_size)[0])
+
+        for images, labels in loader:
+            start = time.perf_counter()
+            logits = predict(images)
+            elapsed += time.perf_counter() - start
+            predictions.append(logits.argmax(dim=1).numpy())
+            targets.append(labels.numpy())
+
+    predictions = np.concatenate(predictions)
+    targets = np.concatenate(targets)
+    confusion = np.zeros((len(CLASS_NAMES), len(CLASS_NAMES)), dtype=int)
+    np.add.at(confusion, (targets, predictions), 1)
+
+    return {
+        "predictions": predictions,
+        "accuracy": float((predictions == targets).mean()),
+        "confusion": confusion,
+        "ms_per_image": elapsed * 1000 / len(targets),
+    }
+
+
+def calibration_loader(size: int, batch_size: int) -> DataLoader:
+    """
+    Loader over a seeded random sample of the training split.
+    """
+    dataset = load_split("train")
+    generator = torch.Generator().manual_seed(SEED)
+    indices = torch.randperm(len(dataset), generator=generator)[:size].tolist()
+    return make_loader(Subset(dataset, indices), batch_size=batch_size, shuffle=False)
+
+
+def compare(results: dict) -> dict:
+    """
+    Compare every variant with the fp32 model, as plain JSON-ready values.
+
+    Args:
+        results (dict): evaluate() results by variant name, including "fp32".
+
+    Returns:
+        dict: For each variant its ms_per_image, speedup, accuracy,
+            accuracy_delta, agreement (fraction of test images predicted the
+            same as fp32), confusion and confusion_delta.
+    """
+    baseline = results["fp32"]
+    return {
+        name: {
+            "ms_per_image": result["ms_per_image"],
+            "speedup": baseline["ms_per_image"] / result["ms_per_image"],
+            "accuracy": result["accuracy"],
+            "accuracy_delta": result["accuracy"] - baseline["accuracy"],
+            "agreement": float(
+                (result["predictions"] == baseline["predictions"]).mean()
+            ),
+            "confusion": result["confusion"].tolist(),
+            "confusion_delta": (result["confusion"] - baseline["confusion"]).tolist(),
+        }
+        for name, result in results.items()
+    }
+
+
+def print_report(report: dict) -> None:
+    print(
+        f"{'variant':<20}{'ms/img':>9}{'speedup':>9}{'accuracy':>10}"
+        f"{'delta':>8}{'agree':>8}  confusion"
+    )
+    for name, row in report.items():
+        print(
+            f"{name:<20}{row['ms_per_image']:>9.2f}{row['speedup']:>8.2f}x"
+            f"{row['accuracy']:>10.4f}{row['accuracy_delta']:>+8.4f}"
+            f"{row['agreement']:>8.4f}"
+            f"  {row['confusion']} ({row['confusion_delta']})"
+        )
+
+
+def save_report(report: dict, output_file: str) -> None:
+    with open(output_file, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Export TorchScript, ONNX and int8 versions of a trained model "
+        "and compare them with the fp32 model on the test split."
+    )
+    parser.add_argument("--model", choices=list(MODELS), default="resnet50")
+    parser.add_argument("--weights", required=True, help="Saved state_dict.")
+    parser.add_argument("--output-dir", default=EXPORT_PATH)
+    parser.add_argument("--calibration-size", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=None)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    threads = args.threads or os.cpu_count() or 1
+    torch.set_num_threads(threads)
+    os.makedirs(args.output_dir, exist_ok=True)
+    prefix = os.path.join(args.output_dir, args.model)
+
+    model = load_model(args.model, args.weights)
+    test_loader = make_loader(
+        load_split("test"), batch_size=args.batch_size, shuffle=False
+    )
+
+    variants = {
+        "fp32": model,
+        "torchscript": to_torchscript(model),
+        "int8_dynamic": to_torchscript(quantize_dynamic_int8(model)),
+    }
+    print(f"Calibrating on {args.calibration_size} training images")
+    variants["int8_static"] = to_torchscript(
+        quantize_static_int8(
+            model, calibration_loader(args.calibration_size, args.batch_size)
+        )
+    )
+
+    for name, variant in variants.items():
+        if name != "fp32":
+            torch.jit.save(variant, f"{prefix}_{name}.pt")
+            print(f"Saved {prefix}_{name}.pt")
+
+    results = {}
+    for name, variant in variants.items():
+        results[name] = evaluate(variant, test_loader)
+
+    if export_onnx(model, f"{prefix}.onnx"):
+        print(f"Saved {prefix}.onnx")
+        predict = onnx_predictor(f"{prefix}.onnx", threads)
+        if predict is not None:
+            results["onnx"] = evaluate(predict, test_loader)
+
+    report = compare(results)
+    print_report(report)
+    save_report(report, f"{prefix}_report.json")
+
+
+if __name__ == "__main__":
+    main()
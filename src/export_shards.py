@@ -0,0 +1,34 @@
+import argparse
+from utils.shards import write_shard
+
+RESIZED_PATH = "./data/resized"
+SHARDS_PATH = "./data/shards"
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Pack the resized dataset into memory-mapped shards."
+    )
+    parser.add_argument(
+        "--rgb",
+        action="store_true",
+        help="Store 3-channel images instead of single-channel grayscale.",
+    )
+    parser.add_argument("--size", type=int, default=224)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+
+    for split in ("train", "test"):
+        write_shard(
+            f"{RESIZED_PATH}/{split}",
+            f"{SHARDS_PATH}/{split}",
+            size=args.size,
+            grayscale=not args.rgb,
+        )
+
+
+if __name__ == "__main__":
+    main()
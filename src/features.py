@@ -0,0 +1,336 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils.data import Dataset
+from loader import RESIZED_PATH, SEED, make_loader
+from models import build_resnet50, load_model
+from utils.formats import load_image
+from utils.manifest import hash_file
+from utils.shards import list_image_folder
+from utils.split import CLASS_NAMES
+
+FEATURES_PATH = "./data/features"
+FEATURE_DIM = 2048
+
+
+class ImageFiles(Dataset):
+    """
+    Decodes a list of image files to uint8 RGB CHW tensors, for make_loader.
+    """
+
+    def __init__(self, paths: list[str]) -> None:
+        self.paths = paths
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def __getitem__(self, idx: int) -> tuple[torch.Tensor, int]:
+        with load_image(self.paths[idx]) as img:
+            array = np.asarray(img.convert("RGB"))
+        return torch.from_numpy(array.copy()).permute(2, 0, 1), 0
+
+
+def build_backbone(weights_path: str | None = None) -> nn.Module:
+    """
+    ResNet50 without its classification head, returning 2048-d features.
+
+    Args:
+        weights_path (str, optional): Fine-tuned state_dict; the ImageNet
+            weights are used when omitted.
+
+    Returns:
+        nn.Module: The backbone, in eval mode.
+    """
+    if weights_path is None:
+        model = build_resnet50(pretrained=True)
+    else:
+        model = load_model("resnet50", weights_path)
+    model.fc = nn.Identity()
+    return model.eval()
+
+
+def weights_hash(model: nn.Module) -> str:
+    """
+    Hash the parameters and buffers of a model, whatever file they came from.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for name, tensor in model.state_dict().items():
+        digest.update(name.encode())
+        digest.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    return digest.hexdigest()
+
+
+class FeatureStore:
+    """
+    Backbone features of images, stored as a float16 N x 2048 memmap.
+
+    Rows are keyed by the content hash of each image, so renamed or moved
+    images keep their features and edited ones get new rows. The store
+    records the hash of the backbone weights it was computed with and is
+    discarded when they change, or when its index and features do not have
+    the same number of rows.
+    """
+
+    def __init__(self, store_dir: str, name: str = "resnet50") -> None:
+        self.features_file = os.path.join(store_dir, f"{name}_features.npy")
+        self.index_file = os.path.join(store_dir, f"{name}_index.json")
+        self.weights = None
+        self.rows = {}
+        self.features = np.zeros((0, FEATURE_DIM), dtype=np.float16)
+
+        if os.path.exists(self.index_file) and os.path.exists(self.features_file):
+            with open(self.index_file, "r") as f:
+                index = json.load(f)
+            features = np.load(self.features_file, mmap_mode="r")
+            if index.get("rows") == len(index["hashes"]) == features.shape[0]:
+                self.weights = index["weights"]
+                self.rows = {key: row for row, key in enumerate(index["hashes"])}
+                self.features = features
+            else:
+                print(f"{self.index_file} does not match its features, ignoring it")
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.rows
+
+    def get(self, keys: list[str]) -> np.ndarray:
+        return np.asarray(self.features[[self.rows[key] for key in keys]])
+
+    def write(self, keys: list[str], new_features: dict[str, np.ndarray]) -> None:
+        """
+        Rewrite the store with exactly the given keys.
+
+        Rows come from new_features when present, otherwise from the current
+        store, so features of images that are gone are dropped.
+
+        Args:
+            keys (list): Content hashes to keep, in row order.
+            new_features (dict): Newly computed features by hash.
+        """
+        os.makedirs(os.path.dirname(self.features_file) or ".", exist_ok=True)
+        tmp_file = self.features_file + ".tmp.npy"
+        features = np.lib.format.open_memmap(
+            tmp_file, mode="w+", dtype=np.float16, shape=(len(keys), FEATURE_DIM)
+        )
+        for row, key in enumerate(keys):
+            if key in new_features:
+                features[row] = new_features[key]
+            else:
+                features[row] = self.features[self.rows[key]]
+        features.flush()
+        del features
+
+        tmp_index = self.index_file + ".tmp"
+        with open(tmp_index, "w") as f:
+            json.dump({"weights": self.weights, "rows": len(keys), "hashes": keys}, f)
+
+        # Retire the old index first, so new rows are never read through it,
+        # and unmap the old features, which Windows cannot replace otherwise
+        if os.path.exists(self.index_file):
+            os.remove(self.index_file)
+        self.features = np.zeros((0, FEATURE_DIM), dtype=np.float16)
+        os.replace(tmp_file, self.features_file)
+        os.replace(tmp_index, self.index_file)
+        self.rows = {key: row for row, key in enumerate(keys)}
+        self.features = np.load(self.features_file, mmap_mode="r")
+
+
+def extract_features(
+    backbone: nn.Module, paths: list[str], batch_size: int = 64
+) -> np.ndarray:
+    """
+    Run the backbone over images in channels-last layout.
+
+    Returns:
+        np.ndarray: float16 array of shape len(paths) x 2048.
+    """
+    loader = make_loader(ImageFiles(paths), batch_size=batch_size, shuffle=False)
+    backbone = backbone.to(memory_format=torch.channels_last)
+    outputs = []
+    with torch.inference_mode():
+        for images, _ in loader:
+            images = images.contiguous(memory_format=torch.channels_last)
+            outputs.append(backbone(images).to(torch.float16).numpy())
+    return (
+        np.concatenate(outputs)
+        if outputs
+        else np.zeros((0, FEATURE_DIM), dtype=np.float16)
+    )
+
+
+def cache_features(
+    backbone: nn.Module,
+    paths: list[str],
+    store_dir: str = FEATURES_PATH,
+    batch_size: int = 64,
+) -> np.ndarray:
+    """
+    Get the backbone features of images, computing only those not cached.
+
+    The store is rewritten to hold exactly these images, so pass every image
+    that should stay cached in one call.
+
+    Args:
+        backbone (nn.Module): Backbone from build_backbone.
+        paths (list): Image paths.
+        store_dir (str): Directory of the feature store.
+        batch_size (int): Images per backbone forward pass.
+
+    Returns:
+        np.ndarray: float16 features of shape len(paths) x 2048.
+    """
+    store = FeatureStore(store_dir)
+    weights = weights_hash(backbone)
+    if store.weights != weights:
+        if store.weights is not None:
+            print("Backbone weights changed, discarding cached features")
+        store.rows = {}
+        store.weights = weights
+
+    keys = [hash_file(path) for path in paths]
+    missing = {}
+    for path, key in zip(paths, keys):
+        if key not in store:
+            missing.setdefault(key, path)
+
+    if missing:
+        start = time.perf_counter()
+        features = extract_features(backbone, list(missing.values()), batch_size)
+        elapsed = time.perf_counter() - start
+        print(
+            f"Computed features of {len(missing)} images in {elapsed:.1f}s, "
+            f"{len(keys) - len(missing)} cached"
+        )
+    else:
+        features = []
+        print(f"All {len(keys)} features cached")
+
+    unique_keys = list(dict.fromkeys(keys))
+    if missing or len(unique_keys) != len(store.rows):
+        store.write(unique_keys, dict(zip(missing, features)))
+    return store.get(keys)
+
+
+def train_head(
+    features: np.ndarray,
+    labels: np.ndarray,
+    epochs: int = 50,
+    lr: float = 0.001,
+    batch_size: int = 256,
+    seed: int = SEED,
+) -> nn.Linear:
+    """
+    Train a 2048 -> 2 linear head on cached features with Adam.
+
+    Args:
+        features (np.ndarray): Features of the training images.
+        labels (np.ndarray): Class indices of the training images.
+        epochs (int): Passes over the features.
+        lr (float): Learning rate.
+        batch_size (int): Features per optimizer step.
+        seed (int): Seed of the initialization and shuffling.
+
+    Returns:
+        nn.Linear: The trained head.
+    """
+    torch.manual_seed(seed)
+    inputs = torch.from_numpy(features.astype(np.float32))
+    targets = torch.from_numpy(labels)
+    head = nn.Linear(FEATURE_DIM, len(CLASS_NAMES))
+    optimizer = torch.optim.Adam(head.parameters(), lr=lr)
+    criterion = nn.CrossEntropyLoss()
+
+    for epoch in range(epochs):
+        permutation = torch.randperm(len(inputs))
+        total_loss = 0.0
+        for start in range(0, len(inputs), batch_size):
+            batch = permutation[start : start + batch_size]
+            optimizer.zero_grad()
+            loss = criterion(head(inputs[batch]), targets[batch])
+            loss.backward()
+            optimizer.step()
+            total_loss += loss.item() * len(batch)
+        if (epoch + 1) % 10 == 0 or epoch + 1 == epochs:
+            print(f"Epoch {epoch + 1}/{epochs}: loss {total_loss / len(inputs):.4f}")
+    return head
+
+
+def evaluate_head(head: nn.Linear, features: np.ndarray, labels: np.ndarray) -> dict:
+    with torch.inference_mode():
+        logits = head(torch.from_numpy(features.astype(np.float32)))
+    predictions = logits.argmax(dim=1).numpy()
+    confusion = np.zeros((len(CLASS_NAMES), len(CLASS_NAMES)), dtype=int)
+    np.add.at(confusion, (labels, predictions), 1)
+    return {"acc": float((predictions == labels).mean()), "confusion": confusion}
+
+
+def list_splits(resized_path: str, splits: list[str]) -> tuple[list[str], dict]:
+    """
+    List the images of several splits, for one cache_features call over all.
+
+    Returns:
+        tuple: (all image paths, {split: (slice into the paths, labels)}).
+    """
+    paths = []
+    spans = {}
+    for split in splits:
+        _, samples = list_image_folder(os.path.join(resized_path, split))
+        labels = np.array([label for _, label in samples], dtype=np.int64)
+        spans[split] = (slice(len(paths), len(paths) + len(samples)), labels)
+        paths.extend(path for path, _ in samples)
+    return paths, spans
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Cache ResNet50 backbone features of the resized images and "
+        "train the classification head from them."
+    )
+    parser.add_argument(
+        "--weights", default=None, help="Fine-tuned ResNet50; ImageNet by default."
+    )
+    parser.add_argument("--resized-path", default=RESIZED_PATH)
+    parser.add_argument("--store-dir", default=FEATURES_PATH)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--epochs", type=int, default=50)
+    parser.add_argument("--lr", type=float, default=0.001)
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="Save the backbone with the trained head as a ResNet50 state_dict.",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    backbone = build_backbone(args.weights)
+
+    # One call for both splits, since the store keeps only the images it is
+    # asked for
+    paths, spans = list_splits(args.resized_path, ["train", "test"])
+    features = cache_features(backbone, paths, args.store_dir, args.batch_size)
+    train_features, train_labels = features[spans["train"][0]], spans["train"][1]
+    test_features, test_labels = features[spans["test"][0]], spans["test"][1]
+
+    start = time.perf_counter()
+    head = train_head(train_features, train_labels, args.epochs, args.lr)
+    print(f"Trained the head in {time.perf_counter() - start:.1f}s")
+
+    test = evaluate_head(head, test_features, test_labels)
+    print(f"Test acc {test['acc']:.4f}")
+    print(f"Confusion matrix (rows true {list(CLASS_NAMES.values())}):")
+    print(test["confusion"])
+
+    if args.output:
+        backbone.fc = head
+        torch.save(backbone.state_dict(), args.output)
+        print(f"Saved the model to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
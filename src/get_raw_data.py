@@ -1,37 +1,172 @@
+import argparse
 import os
-from utils.dcm import process_directory
+from utils.dcm import (
+    index_dicom_directory,
+    process_directory,
+    process_jobs,
+    process_zip,
+)
 from utils.files import (
     clear_data_directory,
+    delete_directory,
     move_files,
     move_random_files,
     process_csv,
     sort_and_rename_files,
 )
+from utils.manifest import Manifest
+from utils.split import (
+    load_rsna_labels,
+    plan_rsna_split,
+    read_split_manifest,
+    write_split_manifest,
+)
 
 RSNA_PATH = "./data/rsna-pneumonia-detection-challenge"
 CHEST_XRAY_PATH = "./data/chest_xray"
 RAW_PATH = "./data/raw_dataset"
+MANIFEST_PATH = "./data/manifest.sqlite"
+RSNA_ZIP = "./data/rsna-pneumonia-detection-challenge.zip"
+RSNA_TRAIN_IMAGES = "./data/stage_2_train_images"
+LABELS_CSV = "./data/stage_2_train_labels.csv"
+SPLIT_MANIFEST = f"{RAW_PATH}/split_manifest.csv"
 SEED = 913
 
+# Inputs and intermediates kept between incremental runs
+INCREMENTAL_KEEP = (
+    "raw_dataset",
+    "resized",
+    "manifest.sqlite",
+    "stage_2_train_images",
+    "stage_2_test_images",
+    "stage_2_train_labels.csv",
+    "rsna-pneumonia-detection-challenge",
+    "rsna-pneumonia-detection-challenge.zip",
+    "rsna-pneumonia-detection-challenge.zip.progress.json",
+)
+
+
+def process_data(
+    backend: str = "thread",
+    max_workers: int | None = None,
+    manifest: Manifest | None = None,
+    fused: bool = False,
+    from_zip: bool = False,
+):
+    # The fused path writes 224x224 crops directly; resize_data.py passes them through
+    resize = (256, 224) if fused else None
+
+    if from_zip:
+        # DICOMs left zipped by download_kaggle_data.py --keep-dicoms-zipped
+        for split, folder in (
+            ("train", "stage_2_train_images/"),
+            ("test", "stage_2_test_images/"),
+        ):
+            print(f"Processing {split} data from {RSNA_ZIP}...")
+            process_zip(
+                RSNA_ZIP,
+                folder,
+                f"{RSNA_PATH}/{split}",
+                max_workers=max_workers,
+                backend=backend,
+                resize=resize,
+            )
+        return
 
-def process_data():
     print("Processing training data...")
     process_directory(
-        "./data/stage_2_train_images", f"{RSNA_PATH}/train", max_workers=12
+        RSNA_TRAIN_IMAGES,
+        f"{RSNA_PATH}/train",
+        max_workers=max_workers,
+        backend=backend,
+        manifest=manifest,
+        resize=resize,
     )
     print("Processing test data...")
-    process_directory("./data/stage_2_test_images", f"{RSNA_PATH}/test", max_workers=12)
+    process_directory(
+        "./data/stage_2_test_images",
+        f"{RSNA_PATH}/test",
+        max_workers=max_workers,
+        backend=backend,
+        manifest=manifest,
+        resize=resize,
+    )
+
+
+def process_selected_rsna(
+    backend: str = "thread",
+    max_workers: int | None = None,
+    manifest: Manifest | None = None,
+    fused: bool = False,
+) -> list[tuple[str, str]]:
+    """
+    Convert only the RSNA images the train/test split selects, straight into
+    raw_dataset, instead of converting and labelling every image first.
+
+    The split is planned from the label CSV and a header-only index of the
+    DICOMs, so unselected files (about 85% of them) are never decoded.
+
+    Returns:
+        list: The (dicom_file, output_file) pairs converted successfully.
+    """
+    resize = (256, 224) if fused else None
+
+    index = index_dicom_directory(RSNA_TRAIN_IMAGES)
+    dicom_files = {
+        os.path.splitext(os.path.basename(dicom_file))[0]: dicom_file
+        for dicom_file in index["dicom_file"]
+    }
+
+    # Only patients with a readable image can be selected, as in process_labels
+    labels = {
+        patient_id: target
+        for patient_id, target in load_rsna_labels(LABELS_CSV).items()
+        if patient_id in dicom_files
+    }
+    plan = plan_rsna_split(labels, SEED)
+
+    jobs = []
+    for patient_id, (split, class_name, filename) in sorted(plan.items()):
+        output_dir = f"{RAW_PATH}/{split}/{class_name}"
+        os.makedirs(output_dir, exist_ok=True)
+        jobs.append((dicom_files[patient_id], f"{output_dir}/{filename}"))
+
+    print(f"Selected {len(jobs)} of {len(dicom_files)} RSNA images for conversion")
+    results = process_jobs(
+        jobs,
+        RSNA_TRAIN_IMAGES,
+        max_workers=max_workers,
+        backend=backend,
+        manifest=manifest,
+        resize=resize,
+    )
+    converted = {result.output_file for result in results if result.success}
+    # Up-to-date files skipped through the manifest are still part of the split
+    return [job for job in jobs if job[1] in converted or os.path.exists(job[1])]
 
 
 def process_labels():
     process_csv(
-        "./data/stage_2_train_labels.csv",
+        LABELS_CSV,
         f"{RSNA_PATH}/train",
         f"{RSNA_PATH}/renamed",
         max_workers=12,
     )
 
 
+def has_xray_inputs() -> bool:
+    """
+    Check whether the chest X-ray images still have to be split.
+
+    They are moved into raw_dataset by the first run and chest_xray is then
+    cleared, so incremental re-runs keep the x-ray images already there.
+    """
+    if os.path.exists(CHEST_XRAY_PATH):
+        return True
+    print(f"{CHEST_XRAY_PATH} not found, keeping the x-ray images in {RAW_PATH}")
+    return False
+
+
 def organize_directories():
     directories = [
         f"{CHEST_XRAY_PATH}/train/NORMAL",
@@ -67,56 +202,165 @@ def move_random_samples():
     )
 
 
-def move_files_to_raw_dataset():
+def move_xray_files_to_raw_dataset() -> list[tuple[str, str]]:
     train_path = f"{RAW_PATH}/train"
     test_path = f"{RAW_PATH}/test"
 
-    # Move XRAY files
-    move_files(
+    moves = move_files(
         f"{CHEST_XRAY_PATH}/train/NORMAL", f"{train_path}/normal", dest_prefix="xray_"
     )
-    move_files(
+    moves += move_files(
         f"{CHEST_XRAY_PATH}/test/NORMAL", f"{test_path}/normal", dest_prefix="xray_"
     )
-    move_files(
+    moves += move_files(
         f"{CHEST_XRAY_PATH}/test/PNEUMONIA",
         f"{test_path}/pneumonia",
         dest_prefix="xray_",
     )
-    move_random_files(
+    moves += move_random_files(
         f"{CHEST_XRAY_PATH}/train/PNEUMONIA",
         f"{train_path}/pneumonia",
         1300,
         SEED,
         dest_prefix="xray_",
     )
+    return moves
+
 
-    # Move RSNA files
+def move_rsna_files_to_raw_dataset() -> list[tuple[str, str]]:
+    train_path = f"{RAW_PATH}/train"
+    test_path = f"{RAW_PATH}/test"
     rsna_normal_path = f"{RSNA_PATH}/renamed/normal"
     rsna_pneumonia_path = f"{RSNA_PATH}/renamed/pneumonia"
 
-    move_random_files(
+    moves = move_random_files(
         rsna_normal_path, f"{train_path}/normal", 1300, SEED, dest_prefix="rsna_"
     )
-    move_random_files(
+    moves += move_random_files(
         rsna_normal_path, f"{test_path}/normal", 370, SEED, dest_prefix="rsna_"
     )
-    move_random_files(
+    moves += move_random_files(
         rsna_pneumonia_path, f"{train_path}/pneumonia", 1300, SEED, dest_prefix="rsna_"
     )
-    move_random_files(
+    moves += move_random_files(
         rsna_pneumonia_path, f"{test_path}/pneumonia", 370, SEED, dest_prefix="rsna_"
     )
+    return moves
+
+
+def move_files_to_raw_dataset() -> list[tuple[str, str]]:
+    return move_xray_files_to_raw_dataset() + move_rsna_files_to_raw_dataset()
+
+
+def save_split_manifest(moves: list[tuple[str, str]]) -> None:
+    """
+    Record where every raw_dataset file came from and which split it is in.
+
+    Rows of an earlier manifest are kept for files still in raw_dataset that
+    this run did not move, such as x-ray images on incremental re-runs.
+    """
+    entries = {}
+    if os.path.exists(SPLIT_MANIFEST):
+        for row in read_split_manifest(SPLIT_MANIFEST).itertuples():
+            if os.path.exists(row.file):
+                file = os.path.relpath(row.file, RAW_PATH)
+                entries[file] = (file, row.split, row.class_name, row.source)
+
+    for src_file, dest_file in moves:
+        file = os.path.relpath(dest_file, RAW_PATH)
+        split, class_name, _ = file.split(os.sep)
+        entries[file] = (file, split, class_name, src_file)
+    write_split_manifest(list(entries.values()), SPLIT_MANIFEST)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Prepare the raw dataset.")
+    parser.add_argument(
+        "--backend",
+        choices=["thread", "process"],
+        default="thread",
+        help="Executor used for DICOM conversion (default: thread).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of conversion workers (default: 12 threads or all cores).",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Skip up-to-date conversions and keep intermediates for the next run.",
+    )
+    parser.add_argument(
+        "--fused",
+        action="store_true",
+        help="Convert DICOMs straight to 224x224 crops without a full-size JPEG.",
+    )
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument(
+        "--from-zip",
+        action="store_true",
+        help="Read the RSNA DICOMs straight from the downloaded zip.",
+    )
+    source.add_argument(
+        "--select-first",
+        action="store_true",
+        help="Plan the RSNA split up front and convert only the selected images.",
+    )
+    args = parser.parse_args()
+    if args.from_zip and args.incremental:
+        # The manifest tracks files on disk; zip members are always converted
+        parser.error("--incremental cannot be combined with --from-zip")
+    return args
 
 
 def main():
-    process_data()
-    process_labels()
-    move_validation_files()
-    move_random_samples()
-    organize_directories()
-    move_files_to_raw_dataset()
-    clear_data_directory("./data", keep="raw_dataset")
+    args = parse_args()
+    manifest = Manifest(MANIFEST_PATH) if args.incremental else None
+
+    if args.select_first:
+        moves = process_selected_rsna(
+            backend=args.backend,
+            max_workers=args.workers,
+            manifest=manifest,
+            fused=args.fused,
+        )
+        if has_xray_inputs():
+            move_validation_files()
+            move_random_samples()
+            organize_directories()
+            moves += move_xray_files_to_raw_dataset()
+    else:
+        process_data(
+            backend=args.backend,
+            max_workers=args.workers,
+            manifest=manifest,
+            fused=args.fused,
+            from_zip=args.from_zip,
+        )
+        if manifest is not None and os.path.exists(f"{RSNA_PATH}/renamed"):
+            # Leftovers from the previous run would collide with the new renames
+            delete_directory(f"{RSNA_PATH}/renamed")
+        process_labels()
+        xray = has_xray_inputs()
+        if xray:
+            move_validation_files()
+            move_random_samples()
+        organize_directories()
+        moves = move_xray_files_to_raw_dataset() if xray else []
+        moves += move_rsna_files_to_raw_dataset()
+
+    save_split_manifest(moves)
+
+    if manifest is not None:
+        manifest.close()
+        clear_data_directory("./data", keep=INCREMENTAL_KEEP)
+    elif args.from_zip:
+        # Keep the archive, it replaces the extracted DICOMs on the next run
+        clear_data_directory("./data", keep=("raw_dataset", os.path.basename(RSNA_ZIP)))
+    else:
+        clear_data_directory("./data", keep="raw_dataset")
 
 
 if __name__ == "__main__":
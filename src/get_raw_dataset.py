@@ -1,12 +1,63 @@
+import shutil
 import threading
-from scrapper_ddg import search_and_download_images
+from pathlib import Path
+from scrapper_ddg import (
+    MAX_IMAGE_BYTES,
+    is_image_response,
+    make_session,
+    read_limited,
+    search_and_download_images,
+    write_filtered,
+)
 from bing_image_downloader import downloader
+from bing_image_downloader.bing import Bing
+from utils.images import DownloadFilter
+
+
+class FilteredBing(Bing):
+    """
+    Bing downloader that runs every image through a DownloadFilter before saving.
+    """
+
+    def __init__(self, *args, image_filter: DownloadFilter, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.image_filter = image_filter
+        self.session = make_session(pool_size=4)
+
+    def run(self):
+        try:
+            super().run()
+        finally:
+            self.session.close()
+
+    def save_image(self, link, file_path):
+        # Raising makes Bing reuse the slot, so rejected images leave no gaps
+        with self.session.get(
+            link, headers=self.headers, timeout=self.timeout, stream=True
+        ) as response:
+            response.raise_for_status()
+            reason = is_image_response(response, MAX_IMAGE_BYTES)
+            if reason:
+                raise ValueError(f"Rejected {link}: {reason}")
+            data = read_limited(response, MAX_IMAGE_BYTES)
+
+        if data is None:
+            raise ValueError(f"Rejected {link}: larger than {MAX_IMAGE_BYTES} bytes")
+        reason = self.image_filter.check(data, link)
+        if reason:
+            raise ValueError(f"Rejected {link}: {reason}")
+        write_filtered(data, link, str(file_path), self.image_filter)
 
 
 def ddg_download(
-    search_term: str, folder_path: str = ".", max_results: int = 10
+    search_term: str,
+    folder_path: str = ".",
+    max_results: int = 10,
+    image_filter: DownloadFilter | None = None,
 ) -> None:
-    search_and_download_images(search_term, folder_path, max_results)
+    search_and_download_images(
+        search_term, folder_path, max_results, image_filter=image_filter
+    )
 
 
 def bing_download(
@@ -16,32 +67,61 @@ def bing_download(
     force_replace: bool = False,
     timeout: int = 2,
     verbose: bool = True,
+    image_filter: DownloadFilter | None = None,
 ) -> None:
-    downloader.download(
+    if image_filter is None:
+        downloader.download(
+            search_term,
+            limit=limit,
+            output_dir=output_dir,
+            force_replace=force_replace,
+            timeout=timeout,
+            verbose=verbose,
+        )
+        return
+
+    # Same folder layout as downloader.download
+    image_dir = Path(output_dir).joinpath(search_term).absolute()
+    if force_replace and image_dir.is_dir():
+        shutil.rmtree(image_dir)
+    image_dir.mkdir(parents=True, exist_ok=True)
+    bing = FilteredBing(
         search_term,
-        limit=limit,
-        output_dir=output_dir,
-        force_replace=force_replace,
-        timeout=timeout,
-        verbose=verbose,
+        limit,
+        image_dir,
+        "off",
+        timeout,
+        "",
+        verbose,
+        image_filter=image_filter,
     )
+    bing.run()
 
 
 if __name__ == "__main__":
+    # Shared by all four threads so an image found twice is only saved once
+    image_filter = DownloadFilter(
+        hash_files=("./fiat_hashes_to_filter.txt", "./gol_hashes_to_filter.txt")
+    )
+
     fiat_search_term = "Fiat Uno Mille"
 
     thread1 = threading.Thread(
-        target=ddg_download, args=(fiat_search_term, "fiat1", 500)
+        target=ddg_download, args=(fiat_search_term, "fiat1", 500, image_filter)
     )
     thread2 = threading.Thread(
-        target=bing_download, args=(fiat_search_term, 500, "fiat2", False, 2, True)
+        target=bing_download,
+        args=(fiat_search_term, 500, "fiat2", False, 2, True, image_filter),
     )
 
     gol_search_term = "VW Gol BX"
 
-    thread3 = threading.Thread(target=ddg_download, args=(gol_search_term, "gol1", 500))
+    thread3 = threading.Thread(
+        target=ddg_download, args=(gol_search_term, "gol1", 500, image_filter)
+    )
     thread4 = threading.Thread(
-        target=bing_download, args=(gol_search_term, 500, "gol2", False, 2, True)
+        target=bing_download,
+        args=(gol_search_term, 500, "gol2", False, 2, True, image_filter),
     )
 
     thread1.start()
@@ -0,0 +1,360 @@
+import argparse
+import csv
+import io
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import torch
+from PIL import Image
+from models import MODELS, load_model
+from utils.dcm import normalize_pixels, read_dicom_pixels
+from utils.resize import resize_and_crop
+from utils.split import CLASS_NAMES
+
+INPUT_EXTENSIONS = (".dcm", ".jpeg", ".jpg", ".png")
+IMAGE_SIZE = 224
+
+
+def is_dicom(data: bytes) -> bool:
+    # DICOM files carry "DICM" after a 128-byte preamble
+    return data[128:132] == b"DICM"
+
+
+def decode_input(data: bytes) -> torch.Tensor:
+    """
+    Turn the bytes of a DICOM or image file into a model input.
+
+    Inputs go through the same steps as the training data: DICOMs are
+    normalized to 8 bits, images not already 224x224 are resized to 256 and
+    center-cropped, and the result is RGB.
+
+    Args:
+        data (bytes): Contents of a DICOM, JPEG or PNG file.
+
+    Returns:
+        torch.Tensor: uint8 tensor of shape 3x224x224.
+    """
+    if is_dicom(data):
+        img = Image.fromarray(normalize_pixels(read_dicom_pixels(io.BytesIO(data))))
+    else:
+        img = Image.open(io.BytesIO(data))
+
+    if img.size != (IMAGE_SIZE, IMAGE_SIZE):
+        img = resize_and_crop(img, crop_size=IMAGE_SIZE)
+    array = np.asarray(img.convert("RGB"))
+    return torch.from_numpy(array.copy()).permute(2, 0, 1)
+
+
+def configure_threads(threads: int | None, interop_threads: int) -> None:
+    """
+    Set PyTorch's thread pools; must run before the first forward pass.
+
+    Args:
+        threads (int, optional): Intra-op threads, all cores by default.
+        interop_threads (int): Inter-op threads. One is enough, since a
+            batch is a single chain of operators.
+    """
+    torch.set_num_threads(threads or os.cpu_count() or 1)
+    try:
+        torch.set_num_interop_threads(interop_threads)
+    except RuntimeError:
+        # Already fixed by earlier parallel work in this process
+        pass
+
+
+class Predictor:
+    """
+    Runs a model on batches of uint8 images, in channels-last layout.
+    """
+
+    def __init__(self, model: torch.nn.Module, channels_last: bool = True) -> None:
+        self.memory_format = (
+            torch.channels_last if channels_last else torch.contiguous_format
+        )
+        self.model = model.eval().to(memory_format=self.memory_format)
+
+    @torch.inference_mode()
+    def predict(self, images: torch.Tensor) -> torch.Tensor:
+        """
+        Args:
+            images (torch.Tensor): uint8 batch of shape Nx3x224x224.
+
+        Returns:
+            torch.Tensor: Class probabilities of shape Nx2.
+        """
+        inputs = images.float().div_(255).contiguous(memory_format=self.memory_format)
+        return torch.softmax(self.model(inputs), dim=1)
+
+    def warmup(self, batch_size: int) -> None:
+        self.predict(
+            torch.zeros(batch_size, 3, IMAGE_SIZE, IMAGE_SIZE, dtype=torch.uint8)
+        )
+
+
+class MicroBatcher:
+    """
+    Groups single-image requests into batches for a Predictor.
+
+    A batch is run as soon as it holds max_batch images, or when the oldest
+    waiting image has waited max_latency_ms, whichever comes first. Latency
+    is measured from submit to result for every image.
+    """
+
+    def __init__(
+        self, predictor: Predictor, max_batch: int = 32, max_latency_ms: float = 10.0
+    ) -> None:
+        self.predictor = predictor
+        self.max_batch = max_batch
+        self.max_latency = max_latency_ms / 1000
+        self.requests = queue.Queue()
+        self.latencies = []
+        self.batch_sizes = []
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, image: torch.Tensor) -> Future:
+        future = Future()
+        self.requests.put((image, future, time.perf_counter()))
+        return future
+
+    def close(self) -> None:
+        self.requests.put(None)
+        self.thread.join()
+
+    def run(self) -> None:
+        while True:
+            item = self.requests.get()
+            if item is None:
+                return
+
+            batch = [item]
+            deadline = item[2] + self.max_latency
+            closing = False
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+
+            self.run_batch(batch)
+            if closing:
+                return
+
+    def run_batch(self, batch: list) -> None:
+        try:
+            probabilities = self.predictor.predict(
+                torch.stack([image for image, _, _ in batch])
+            )
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        done = time.perf_counter()
+        with self.lock:
+            self.batch_sizes.append(len(batch))
+            self.latencies.extend(done - submitted for _, _, submitted in batch)
+        for (_, future, _), row in zip(batch, probabilities):
+            future.set_result(row.tolist())
+
+    def stats(self, elapsed: float | None = None) -> dict:
+        """
+        Summarize latencies so far; images_per_sec needs the wall-clock time.
+        """
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000
+            batch_sizes = list(self.batch_sizes)
+
+        stats = {"images": len(latencies)}
+        if len(latencies):
+            stats["p50_ms"] = round(float(np.percentile(latencies, 50)), 2)
+            stats["p99_ms"] = round(float(np.percentile(latencies, 99)), 2)
+            stats["mean_batch"] = round(float(np.mean(batch_sizes)), 2)
+        if elapsed:
+            stats["images_per_sec"] = round(len(latencies) / elapsed, 2)
+        return stats
+
+
+def to_prediction(probabilities: list[float]) -> dict:
+    label = int(np.argmax(probabilities))
+    return {"class": CLASS_NAMES[label], "probabilities": probabilities}
+
+
+def list_inputs(input_dir: str) -> list[str]:
+    paths = []
+    for root, _, files in os.walk(input_dir):
+        for file in files:
+            if file.lower().endswith(INPUT_EXTENSIONS):
+                paths.append(os.path.join(root, file))
+    return sorted(paths)
+
+
+def predict_directory(
+    batcher: MicroBatcher, input_dir: str, output_csv: str, decode_workers: int = 4
+) -> None:
+    """
+    Score every DICOM and image under a directory and save the predictions.
+
+    Files are decoded on a thread pool and streamed into the batcher, so
+    decoding overlaps with inference. Files that cannot be decoded are
+    reported and left out of the CSV.
+
+    Args:
+        batcher (MicroBatcher): The batcher to submit images to.
+        input_dir (str): Directory to scan recursively.
+        output_csv (str): Path of the CSV to write (file, class, probabilities).
+        decode_workers (int): Number of decoding threads.
+    """
+    paths = list_inputs(input_dir)
+
+    def decode(path: str) -> tuple[torch.Tensor | None, Exception | None]:
+        try:
+            with open(path, "rb") as f:
+                return decode_input(f.read()), None
+        except Exception as e:
+            return None, e
+
+    start = time.perf_counter()
+    futures = []
+    failed = 0
+    with ThreadPoolExecutor(max_workers=decode_workers) as executor:
+        for path, (image, error) in zip(paths, executor.map(decode, paths)):
+            if error is not None:
+                print(f"Failed to decode {path}. Reason: {error}")
+                failed += 1
+            else:
+                futures.append((path, batcher.submit(image)))
+
+    rows = []
+    for path, future in futures:
+        prediction = to_prediction(future.result())
+        rows.append([path, prediction["class"], *prediction["probabilities"]])
+    elapsed = time.perf_counter() - start
+
+    with open(output_csv, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(
+            ["file", "class", *(f"p_{name}" for name in CLASS_NAMES.values())]
+        )
+        writer.writerows(rows)
+
+    print(
+        f"Wrote {len(rows)} predictions to {output_csv} "
+        f"({failed} files could not be decoded)"
+    )
+    print(json.dumps(batcher.stats(elapsed)))
+
+
+def make_handler(batcher: MicroBatcher, started: float):
+    class InferenceHandler(BaseHTTPRequestHandler):
+        """
+        POST /predict with a DICOM, JPEG or PNG body; GET /stats for latencies.
+        """
+
+        def send_json(self, status: int, body: dict) -> None:
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self) -> None:
+            if self.path != "/stats":
+                self.send_json(404, {"error": "not found"})
+                return
+            self.send_json(200, batcher.stats(time.perf_counter() - started))
+
+        def do_POST(self) -> None:
+            if self.path != "/predict":
+                self.send_json(404, {"error": "not found"})
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                image = decode_input(self.rfile.read(length))
+            except Exception as e:
+                self.send_json(400, {"error": f"could not decode input: {e}"})
+                return
+            self.send_json(200, to_prediction(batcher.submit(image).result()))
+
+        def log_message(self, format, *args) -> None:
+            # One line per request would dominate the output under load
+            pass
+
+    return InferenceHandler
+
+
+def serve(batcher: MicroBatcher, host: str, port: int) -> None:
+    server = ThreadingHTTPServer(
+        (host, port), make_handler(batcher, time.perf_counter())
+    )
+    print(f"Serving on http://{host}:{port} (POST /predict, GET /stats)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(batcher.stats()))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Score radiographs with a trained ResNet50 or CNNModel."
+    )
+    parser.add_argument("--model", choices=list(MODELS), default="resnet50")
+    parser.add_argument("--weights", required=True, help="Saved state_dict.")
+    parser.add_argument("--input-dir", help="Score every file under this directory.")
+    parser.add_argument("--output", default="./predictions.csv")
+    parser.add_argument("--serve", action="store_true", help="Run the HTTP endpoint.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--max-latency-ms", type=float, default=10.0)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--interop-threads", type=int, default=1)
+    parser.add_argument("--decode-workers", type=int, default=4)
+    parser.add_argument(
+        "--no-channels-last",
+        action="store_true",
+        help="Keep the default NCHW layout instead of channels-last.",
+    )
+    args = parser.parse_args()
+    if bool(args.input_dir) == args.serve:
+        parser.error("pass exactly one of --input-dir or --serve")
+    return args
+
+
+def main() -> None:
+    args = parse_args()
+    configure_threads(args.threads, args.interop_threads)
+
+    model = load_model(args.model, args.weights)
+    predictor = Predictor(model, channels_last=not args.no_channels_last)
+    predictor.warmup(args.max_batch)
+    batcher = MicroBatcher(predictor, args.max_batch, args.max_latency_ms)
+
+    try:
+        if args.serve:
+            serve(batcher, args.host, args.port)
+        else:
+            predict_directory(batcher, args.input_dir, args.output, args.decode_workers)
+    finally:
+        batcher.close()
+
+
+if __name__ == "__main__":
+    main()
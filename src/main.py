@@ -1,9 +1,7 @@
 from utils.files import move_files, delete_directory
-from utils.images import (
-    find_and_remove_duplicates,
-    remove_corrupted_images,
-    filter_dataset,
-)
+from utils.images import clean_dataset
+
+HASH_CACHE = "./.hash_cache.sqlite"
 
 if __name__ == "__main__":
     # move_files("./gol2/VW Gol BX", "./gol")
@@ -14,15 +12,19 @@ if __name__ == "__main__":
     # delete_directory("./fiat2")
     # delete_directory("./gol1")
     # delete_directory("./gol2")
-    # find_and_remove_duplicates("./fiat")
-    # find_and_remove_duplicates("./gol")
-    # remove_corrupted_images("./fiat")
-    # remove_corrupted_images("./gol")
-    # filtered_output_directory = "./filtered_fiat"
-    # filter_dataset(
-    #     "./fiat", "./fiat_hashes_to_filter.txt", filtered_output_directory
+    # clean_dataset(
+    #     "./fiat",
+    #     "./fiat_hashes_to_filter.txt",
+    #     "./filtered_fiat",
+    #     cache_file=HASH_CACHE,
+    #     report_file="./fiat_report.csv",
+    # )
+    # clean_dataset(
+    #     "./gol",
+    #     "./gol_hashes_to_filter.txt",
+    #     "./filtered_gol",
+    #     cache_file=HASH_CACHE,
+    #     report_file="./gol_report.csv",
     # )
-    # filtered_output_directory = "./filtered_gol"
-    # filter_dataset("./gol", "./gol_hashes_to_filter.txt", filtered_output_directory)
     delete_directory("./gol")
     delete_directory("./fiat")
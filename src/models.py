@@ -0,0 +1,85 @@
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torchvision import models
+
+
+class CNNModel(nn.Module):
+    """
+    Three-block convolutional classifier from the training notebook.
+
+    Expects 3x224x224 inputs in [0, 1], as produced by transforms.ToTensor.
+    """
+
+    def __init__(self):
+        super(CNNModel, self).__init__()
+        self.conv1 = nn.Conv2d(
+            in_channels=3, out_channels=32, kernel_size=3, stride=1, padding=1
+        )
+        self.pool = nn.MaxPool2d(kernel_size=2, stride=2, padding=0)
+        self.conv2 = nn.Conv2d(
+            in_channels=32, out_channels=64, kernel_size=3, stride=1, padding=1
+        )
+        self.conv3 = nn.Conv2d(
+            in_channels=64, out_channels=128, kernel_size=3, stride=1, padding=1
+        )
+        self.fc1 = nn.Linear(128 * 28 * 28, 512)
+        self.fc2 = nn.Linear(512, 2)
+        self.dropout = nn.Dropout(0.5)
+
+    def forward(self, x):
+        x = self.pool(F.relu(self.conv1(x)))
+        x = self.pool(F.relu(self.conv2(x)))
+        x = self.pool(F.relu(self.conv3(x)))
+        # reshape instead of view, so channels-last inputs work too
+        x = x.reshape(-1, 128 * 28 * 28)
+        x = F.relu(self.fc1(x))
+        x = self.dropout(x)
+        x = self.fc2(x)
+        return x
+
+
+def build_resnet50(pretrained: bool = False) -> nn.Module:
+    """
+    ResNet50 with a two-class head, as fine-tuned in the training notebook.
+
+    Args:
+        pretrained (bool): Start from the IMAGENET1K_V1 weights (downloaded
+            on first use), the ones pretrained=True gives in the notebook,
+            instead of random initialization.
+
+    Returns:
+        nn.Module: The model.
+    """
+    weights = models.ResNet50_Weights.IMAGENET1K_V1 if pretrained else None
+    model = models.resnet50(weights=weights)
+    model.fc = nn.Linear(model.fc.in_features, 2)
+    return model
+
+
+MODELS = {
+    "resnet50": build_resnet50,
+    "cnn": CNNModel,
+}
+
+
+def load_model(name: str, weights_path: str | None = None) -> nn.Module:
+    """
+    Build a model and load saved weights for inference on the CPU.
+
+    Args:
+        name (str): One of MODELS.
+        weights_path (str, optional): state_dict saved with torch.save; the
+            model keeps its initial weights when omitted.
+
+    Returns:
+        nn.Module: The model, in eval mode.
+    """
+    if name not in MODELS:
+        raise ValueError(f"Unknown model {name!r}, expected one of {list(MODELS)}")
+
+    model = MODELS[name]()
+    if weights_path is not None:
+        state_dict = torch.load(weights_path, map_location="cpu", weights_only=True)
+        model.load_state_dict(state_dict)
+    return model.eval()
@@ -1,82 +1,372 @@
+import argparse
 import os
-from concurrent.futures import ThreadPoolExecutor
+import shutil
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from PIL import Image
-from utils.files import clear_data_directory
+from utils.files import chunked, clear_data_directory
+from utils.formats import OutputFormat, parse_output_format, save_image
+from utils.manifest import Manifest
+from utils.resize import DRAFT_OVERSAMPLE, pyramid_target_size, resize_pyramid
+from utils.split import read_split_manifest
+
+MANIFEST_PATH = "./data/manifest.sqlite"
+RAW_PATH = "./data/raw_dataset"
+SPLIT_MANIFEST = f"{RAW_PATH}/split_manifest.csv"
+
+
+# The default level; other levels get their size appended to manifest stages
+DEFAULT_LEVEL = (256, 224)
 
 
 def resize_and_crop_image(
-    input_file: str, output_file: str, target_size: int = 256, crop_size: int = 224
+    input_file: str,
+    output_file: str,
+    target_size: int = 256,
+    crop_size: int = 224,
+    fast: bool = False,
+    output_format: OutputFormat = OutputFormat(),
 ) -> None:
     """
     Resize an image to the target size and then crop the center to the crop size.
 
+    Images that already have the crop size, such as those written by the fused
+    DICOM stage, are copied as they are instead of being re-encoded when the
+    output is a plain JPEG too.
+
     Args:
         input_file (str): Path to the input image file.
         output_file (str): Path to the output image file.
         target_size (int): Size to resize the image to (default is 256x256).
         crop_size (int): Size to crop the center of the image (default is 224x224).
+        fast (bool): Use draft-mode JPEG decoding (see utils.resize).
+        output_format (OutputFormat): How to encode the output image.
+    """
+    resize_pyramid_image(
+        input_file, [((target_size, crop_size), output_file)], fast, output_format
+    )
+
+
+def resize_pyramid_image(
+    input_file: str,
+    outputs: list[tuple[tuple[int, int], str]],
+    fast: bool = False,
+    output_format: OutputFormat = OutputFormat(),
+) -> list[tuple[tuple[int, int], str]]:
+    """
+    Write several resized and cropped versions of an image from a single decode.
+
+    Levels whose crop is larger than the input are skipped, since they would
+    only be upscaled from it, e.g. the larger sizes of an image the fused DICOM
+    stage already wrote at 224x224.
+
+    Args:
+        input_file (str): Path to the input image file.
+        outputs (list): ((target_size, crop_size), output_file) pairs.
+        fast (bool): Use draft-mode JPEG decoding (see utils.resize).
+        output_format (OutputFormat): How to encode the output images.
+
+    Returns:
+        list: The outputs that were written.
     """
     with Image.open(input_file) as img:
-        img = img.resize((target_size, target_size), Image.LANCZOS)
+        written = [
+            (level, output_file)
+            for level, output_file in outputs
+            if level[1] <= min(img.size)
+        ]
+        pending = []
+        for (target_size, crop_size), output_file in written:
+            if (
+                img.size == (crop_size, crop_size)
+                and img.format == "JPEG"
+                and output_format.is_plain_jpeg(img)
+            ):
+                shutil.copy(input_file, output_file)
+            else:
+                pending.append(((target_size, crop_size), output_file))
+        if not pending:
+            return written
+
+        levels = [level for level, _ in pending]
+        if output_format.grayscale and img.mode != "L":
+            if fast:
+                # Decode the luma plane only, already downscaled
+                draft_size = max(target for target, _ in levels) * DRAFT_OVERSAMPLE
+                img.draft("L", (draft_size, draft_size))
+            img = img.convert("L")
 
-        left = (target_size - crop_size) / 2
-        top = (target_size - crop_size) / 2
-        right = (target_size + crop_size) / 2
-        bottom = (target_size + crop_size) / 2
+        crops = resize_pyramid(img, levels, fast)
+        for crop, (_, output_file) in zip(crops, pending):
+            save_image(crop, output_file, output_format)
+    return written
 
-        img = img.crop((left, top, right, bottom))
 
-        img.save(output_file, "JPEG")
+def process_image_file(
+    input_file: str,
+    outputs: list[tuple[tuple[int, int], str]],
+    fast: bool = False,
+    output_format: OutputFormat = OutputFormat(),
+) -> list[tuple[tuple[int, int], str]]:
+    written = resize_pyramid_image(input_file, outputs, fast, output_format)
+    for level, output_file in outputs:
+        if (level, output_file) in written:
+            print(f"Processed {input_file} to {output_file}")
+        else:
+            print(
+                f"Skipped {output_file}: {input_file} is smaller than "
+                f"the {level[1]}x{level[1]} crop"
+            )
+    return written
 
 
-def process_image_file(input_file: str, output_file: str) -> None:
-    resize_and_crop_image(input_file, output_file)
-    print(f"Processed {input_file} to {output_file}")
+def process_image_chunk(
+    jobs: list[tuple[str, list[tuple[tuple[int, int], str]]]],
+    fast: bool = False,
+    output_format: OutputFormat = OutputFormat(),
+) -> list[list[tuple[tuple[int, int], str]]]:
+    return [
+        process_image_file(input_file, outputs, fast, output_format)
+        for input_file, outputs in jobs
+    ]
 
 
 def process_image_directory(
-    input_dir: str, output_dir: str, max_workers: int = 12
+    input_dir: str,
+    output_dir: str | dict[tuple[int, int], str],
+    max_workers: int = 12,
+    manifest: Manifest | None = None,
+    fast: bool = False,
+    backend: str = "thread",
+    chunk_size: int = 32,
+    output_format: OutputFormat = OutputFormat(),
+    input_files: list[str] | None = None,
 ) -> None:
     """
     Process all image files in a directory, resize and crop them, and save them to the output directory.
 
     Args:
         input_dir (str): Path to the directory containing image files.
-        output_dir (str): Path to the directory to save processed image files.
-        max_workers (int): Maximum number of threads to use.
+        output_dir (str | dict): Path to the directory to save processed image
+            files, or a mapping of (target_size, crop_size) levels to output
+            directories. Each image is then decoded once and the levels
+            cascade from the largest down.
+        max_workers (int): Maximum number of threads or processes to use.
+        manifest (Manifest, optional): When given, images whose resized output
+            is already up to date are skipped and new outputs are recorded.
+        fast (bool): Use draft-mode JPEG decoding, several times faster on
+            large inputs at a small, bounded quality cost.
+        backend (str): "thread" or "process". Decoding and resampling hold
+            the GIL part of the time, so processes scale further on many cores.
+        chunk_size (int): Number of images handed to a process worker at once.
+        output_format (OutputFormat): Output encoding; plain JPEG by default.
+            Outputs take the format's extension.
+        input_files (list, optional): The images to process, e.g. from the
+            split manifest; input_dir is scanned for images when omitted.
     """
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = []
-        for root, _, files in os.walk(input_dir):
-            for file in files:
-                if file.lower().endswith((".jpeg", ".jpg", ".png")):
-                    input_file = os.path.join(root, file)
-                    output_file = os.path.join(
-                        output_dir, os.path.splitext(file)[0] + ".jpeg"
-                    )
-                    futures.append(
-                        executor.submit(process_image_file, input_file, output_file)
-                    )
-
-        for future in futures:
-            future.result()
+    if backend not in ("thread", "process"):
+        raise ValueError(f"Unknown backend {backend!r}, expected 'thread' or 'process'")
 
+    if isinstance(output_dir, str):
+        output_dir = {DEFAULT_LEVEL: output_dir}
+    levels = list(output_dir)
+    if len(set(output_dir.values())) < len(levels):
+        raise ValueError("Every level needs its own output directory")
 
-def main() -> None:
-    directories = {
-        "./data/raw_dataset/train/normal": "./data/resized/train/normal",
-        "./data/raw_dataset/train/pneumonia": "./data/resized/train/pneumonia",
-        "./data/raw_dataset/test/normal": "./data/resized/test/normal",
-        "./data/raw_dataset/test/pneumonia": "./data/resized/test/pneumonia",
+    for level_dir in output_dir.values():
+        if not os.path.exists(level_dir):
+            os.makedirs(level_dir)
+
+    # Fast outputs differ slightly, so switching modes redoes the images
+    stage = "resize_fast" if fast else "resize"
+    if output_format != OutputFormat():
+        stage += f"_{output_format.tag}"
+    stages = {
+        level: stage if level == DEFAULT_LEVEL else "{}_{}_{}".format(stage, *level)
+        for level in levels
     }
 
-    for input_dir, output_dir in directories.items():
-        process_image_directory(input_dir, output_dir)
+    jobs = []
+    skipped = 0
+    if input_files is None:
+        input_files = [
+            os.path.join(root, file)
+            for root, _, files in os.walk(input_dir)
+            for file in files
+            if file.lower().endswith((".jpeg", ".jpg", ".png"))
+        ]
+
+    for input_file in input_files:
+        name = os.path.splitext(os.path.basename(input_file))[0]
+        name += output_format.extension
+        outputs = [(level, os.path.join(output_dir[level], name)) for level in levels]
+        if manifest is not None:
+            outputs = [
+                (level, output_file)
+                for level, output_file in outputs
+                if not manifest.is_up_to_date(stages[level], input_file, output_file)
+            ]
+            skipped += len(levels) - len(outputs)
+        if outputs:
+            jobs.append((input_file, outputs))
+
+    if manifest is not None:
+        print(f"Skipping {skipped} up-to-date images in {input_dir}")
+
+    too_small = 0
+
+    def finish(
+        job: tuple[str, list[tuple[tuple[int, int], str]]],
+        written: list[tuple[tuple[int, int], str]],
+    ) -> None:
+        nonlocal too_small
+        input_file, outputs = job
+        too_small += len(outputs) - len(written)
+        # Skipped levels stay unrecorded, so a larger input is picked up later
+        if manifest is not None:
+            for level, output_file in written:
+                manifest.record(stages[level], input_file, output_file)
+
+    if backend == "process":
+        chunks = chunked(jobs, chunk_size)
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(process_image_chunk, chunk, fast, output_format)
+                for chunk in chunks
+            ]
+
+            for future, chunk in zip(futures, chunks):
+                for job, written in zip(chunk, future.result()):
+                    finish(job, written)
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(process_image_file, *job, fast, output_format)
+                for job in jobs
+            ]
+
+            for future, job in zip(futures, jobs):
+                finish(job, future.result())
+
+    if too_small:
+        print(
+            f"Skipped {too_small} outputs in {input_dir} larger than their input, "
+            "which would only be upscaled"
+        )
+
+    if manifest is not None:
+        manifest.commit()
+
+
+def list_split_files() -> dict[tuple[str, str], list[str]] | None:
+    """
+    Group the raw images listed in the split manifest by split and class.
+
+    Returns:
+        dict | None: Image paths by (split, class_name), or None when
+            get_raw_data.py wrote no manifest and the directories must be
+            scanned instead.
+    """
+    if not os.path.exists(SPLIT_MANIFEST):
+        return None
+
+    # Same paths as a directory scan, which key the incremental manifest
+    raw_root = os.path.abspath(RAW_PATH)
+    split_files = {}
+    for row in read_split_manifest(SPLIT_MANIFEST).itertuples():
+        input_file = os.path.join(RAW_PATH, os.path.relpath(row.file, raw_root))
+        split_files.setdefault((row.split, row.class_name), []).append(input_file)
+    return split_files
+
+
+def resized_path(crop_size: int) -> str:
+    """
+    Root of the resized dataset for a crop size; 224 keeps the historical path.
+    """
+    return "./data/resized" if crop_size == 224 else f"./data/resized_{crop_size}"
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Resize the raw dataset.")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Skip up-to-date images and keep the raw dataset for the next run.",
+    )
+    parser.add_argument(
+        "--fast",
+        action="store_true",
+        help="Decode JPEGs in draft mode before resizing (see benchmarks/bench_resize.py).",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["thread", "process"],
+        default="thread",
+        help="Executor used for resizing (default: thread).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=12,
+        help="Number of resize workers (default: 12).",
+    )
+    parser.add_argument(
+        "--format",
+        type=parse_output_format,
+        default=OutputFormat(),
+        help=(
+            "Output format: jpeg, png, webp (lossless) or npy, with options "
+            "gray, q<quality> and s<subsampling>, e.g. 'png,gray' or 'jpeg,gray,q90'."
+        ),
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[224],
+        help=(
+            "Crop sizes to write in one pass, e.g. '--sizes 128 224 299 384'. "
+            "Each goes to ./data/resized_<size> (224 to ./data/resized)."
+        ),
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    manifest = Manifest(MANIFEST_PATH) if args.incremental else None
+    split_files = list_split_files()
+    if split_files is not None:
+        print(f"Listing the raw images from {SPLIT_MANIFEST}")
+
+    for split in ("train", "test"):
+        for class_name in ("normal", "pneumonia"):
+            output_dirs = {
+                (pyramid_target_size(size), size): (
+                    f"{resized_path(size)}/{split}/{class_name}"
+                )
+                for size in args.sizes
+            }
+            process_image_directory(
+                f"{RAW_PATH}/{split}/{class_name}",
+                output_dirs,
+                max_workers=args.workers,
+                manifest=manifest,
+                fast=args.fast,
+                backend=args.backend,
+                output_format=args.format,
+                input_files=(
+                    None
+                    if split_files is None
+                    else split_files.get((split, class_name), [])
+                ),
+            )
 
-    clear_data_directory("./data", keep="resized")
+    if manifest is not None:
+        # Leave the raw dataset and intermediates in place for the next run
+        manifest.close()
+    else:
+        keep = tuple(os.path.basename(resized_path(size)) for size in args.sizes)
+        clear_data_directory("./data", keep=keep)
 
 
 if __name__ == "__main__":
@@ -1,43 +1,276 @@
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from urllib.parse import urlsplit
 import requests
 from duckduckgo_search import DDGS
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
+from utils.images import DownloadFilter
 
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
 
-def download_image(image_url, folder_path, image_name):
+
+def make_session(pool_size: int = 32) -> requests.Session:
+    """
+    Build a session with retries and a keep-alive pool shared by all downloads.
+
+    Args:
+        pool_size (int): Connections kept open per host.
+
+    Returns:
+        requests.Session: The configured session.
+    """
     retry_strategy = Retry(
         total=3,
         backoff_factor=1,
         status_forcelist=[429, 500, 502, 503, 504],
     )
-    adapter = HTTPAdapter(max_retries=retry_strategy)
+    adapter = HTTPAdapter(
+        max_retries=retry_strategy, pool_connections=pool_size, pool_maxsize=pool_size
+    )
     http = requests.Session()
     http.mount("http://", adapter)
     http.mount("https://", adapter)
+    return http
+
+
+class HostLimiter:
+    """
+    Caps the number of concurrent requests made to any single host.
+    """
+
+    def __init__(self, per_host: int = 4) -> None:
+        self.per_host = per_host
+        self.semaphores = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, url: str):
+        host = urlsplit(url).netloc
+        with self.lock:
+            semaphore = self.semaphores.setdefault(
+                host, threading.BoundedSemaphore(self.per_host)
+            )
+        with semaphore:
+            yield
+
+
+def is_image_response(response: requests.Response, max_bytes: int) -> str | None:
+    """
+    Check the response headers before any of the body is read.
+
+    Args:
+        response (requests.Response): A streamed response.
+        max_bytes (int): Largest accepted body size.
+
+    Returns:
+        str | None: The reason to reject the response, or None to accept it.
+    """
+    content_type = response.headers.get("Content-Type", "").split(";")[0].strip()
+    if content_type and not (
+        content_type.startswith("image/") or content_type == "application/octet-stream"
+    ):
+        return f"unexpected content type {content_type}"
+
+    content_length = response.headers.get("Content-Length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        return f"too large ({content_length} bytes)"
+
+    return None
+
+
+def read_limited(response: requests.Response, max_bytes: int) -> bytes | None:
+    """
+    Read a streamed response body, giving up once it exceeds max_bytes.
+
+    Returns:
+        bytes | None: The body, or None if it is too large.
+    """
+    data = bytearray()
+    for chunk in response.iter_content(CHUNK_SIZE):
+        data += chunk
+        if len(data) > max_bytes:
+            return None
+    return bytes(data)
+
+
+def write_filtered(
+    data: bytes, source: str, image_path: str, image_filter: DownloadFilter
+) -> None:
+    """
+    Write bytes accepted by image_filter.check, then commit them to the
+    filter; a failed write releases them so the image can still be saved.
+    """
+    partial_path = image_path + ".part"
+    try:
+        with open(partial_path, "wb") as handler:
+            handler.write(data)
+        os.replace(partial_path, image_path)
+    except Exception:
+        image_filter.release(source)
+        raise
+    image_filter.commit(source)
+
+
+def save_filtered(
+    response: requests.Response,
+    image_url: str,
+    image_path: str,
+    max_bytes: int,
+    image_filter: DownloadFilter,
+) -> str | None:
+    """
+    Buffer a response in memory and save it only if the filter accepts it.
+    """
+    data = read_limited(response, max_bytes)
+    if data is None:
+        print(f"Skipped {image_url}: larger than {max_bytes} bytes")
+        return None
+
+    reason = image_filter.check(data, image_url)
+    if reason:
+        print(f"Skipped {image_url}: {reason}")
+        return None
+
+    write_filtered(data, image_url, image_path, image_filter)
+    print(f"Downloaded: {image_path}")
+    return image_path
+
+
+def download_image(
+    image_url,
+    folder_path,
+    image_name,
+    session: requests.Session | None = None,
+    limiter: HostLimiter | None = None,
+    max_bytes: int = MAX_IMAGE_BYTES,
+    image_filter: DownloadFilter | None = None,
+) -> str | None:
+    """
+    Download one image, streaming it to disk.
+
+    The body is written to a temporary file and only renamed into place
+    once complete, so aborted downloads never leave partial images. With an
+    image_filter the body is held in memory and checked first, so corrupted,
+    tiny, blocklisted or duplicate images are never written.
+
+    Args:
+        image_url (str): URL of the image.
+        folder_path (str): Directory to save the image in.
+        image_name (str): File name of the saved image.
+        session (requests.Session, optional): Shared session; a new one is
+            created when omitted.
+        limiter (HostLimiter, optional): Per-host concurrency limit.
+        max_bytes (int): Largest accepted image size.
+        image_filter (DownloadFilter, optional): Filter shared by all downloads.
+
+    Returns:
+        str | None: Path of the saved image, or None if it was skipped.
+    """
+    http = session or make_session(pool_size=1)
+    image_path = os.path.join(folder_path, image_name)
+    partial_path = image_path + ".part"
 
     try:
-        response = http.get(image_url, timeout=10)
-        response.raise_for_status()  # Raise an HTTPError for bad responses (4xx and 5xx)
-        image_path = os.path.join(folder_path, image_name)
-        with open(image_path, "wb") as handler:
-            handler.write(response.content)
+        with limiter.slot(image_url) if limiter else nullcontext():
+            with http.get(image_url, timeout=10, stream=True) as response:
+                response.raise_for_status()  # Raise an HTTPError for bad responses (4xx and 5xx)
+
+                reason = is_image_response(response, max_bytes)
+                if reason:
+                    print(f"Skipped {image_url}: {reason}")
+                    return None
+
+                if image_filter is not None:
+                    return save_filtered(
+                        response, image_url, image_path, max_bytes, image_filter
+                    )
+
+                written = 0
+                with open(partial_path, "wb") as handler:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        written += len(chunk)
+                        if written > max_bytes:
+                            break
+                        handler.write(chunk)
+
+        if written > max_bytes:
+            os.remove(partial_path)
+            print(f"Skipped {image_url}: larger than {max_bytes} bytes")
+            return None
+
+        os.replace(partial_path, image_path)
         print(f"Downloaded: {image_path}")
-    except requests.exceptions.RequestException as e:
+        return image_path
+    except (requests.exceptions.RequestException, OSError) as e:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
         print(f"Failed to download {image_url}: {e}")
+        return None
+    finally:
+        if session is None:
+            http.close()
+
 
+def download_images(
+    image_urls: list[str],
+    folder_path: str,
+    max_workers: int = 32,
+    per_host: int = 4,
+    name_prefix: str = "ddg_",
+    image_filter: DownloadFilter | None = None,
+) -> list[str]:
+    """
+    Download many images concurrently over one pooled session.
 
-def search_and_download_images(query, folder_path, max_results=5):
+    Args:
+        image_urls (list): URLs to download; the i-th one is saved as
+            f"{name_prefix}{i + 1}.jpg".
+        folder_path (str): Directory to save the images in.
+        max_workers (int): Number of concurrent downloads.
+        per_host (int): Maximum concurrent downloads from one host.
+        name_prefix (str): Prefix of the saved file names.
+        image_filter (DownloadFilter, optional): Filter applied before saving.
+
+    Returns:
+        list: Paths of the images saved.
+    """
     if not os.path.exists(folder_path):
         os.makedirs(folder_path)
 
+    limiter = HostLimiter(per_host)
+    with make_session(pool_size=max(per_host, 1)) as session:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(
+                lambda job: download_image(
+                    job[1],
+                    folder_path,
+                    f"{name_prefix}{job[0] + 1}.jpg",
+                    session,
+                    limiter,
+                    image_filter=image_filter,
+                ),
+                enumerate(image_urls),
+            )
+            saved = [path for path in results if path]
+
+    print(f"Downloaded {len(saved)} of {len(image_urls)} images to {folder_path}")
+    return saved
+
+
+def search_and_download_images(
+    query, folder_path, max_results=5, max_workers=32, per_host=4, image_filter=None
+):
     ddgs = DDGS()
     results = ddgs.images(keywords=query, max_results=max_results)
 
-    for i, result in enumerate(results):
-        image_url = result["image"]
-        image_name = f"ddg_{i + 1}.jpg"
-        download_image(image_url, folder_path, image_name)
+    image_urls = [result["image"] for result in results]
+    return download_images(
+        image_urls, folder_path, max_workers, per_host, image_filter=image_filter
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,273 @@
+import argparse
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image
+from utils.dcm import list_dicom_jobs, normalize_pixels, read_dicom_pixels
+from utils.resize import resize_and_crop
+from utils.split import load_rsna_labels, plan_rsna_split
+
+RSNA_IMAGES_PATH = "./data/stage_2_train_images"
+LABELS_CSV = "./data/stage_2_train_labels.csv"
+RESIZED_PATH = "./data/resized"
+SEED = 913
+
+# Marks the end of a stream between two stages
+_DONE = object()
+
+
+def decode_dicom(dicom_file: str) -> tuple[str, np.ndarray | None, str | None]:
+    """
+    Decode and normalize a DICOM file inside a worker process.
+
+    Args:
+        dicom_file (str): Path to the DICOM file.
+
+    Returns:
+        tuple: (dicom_file, uint8 pixels or None, error message or None).
+    """
+    try:
+        return dicom_file, normalize_pixels(read_dicom_pixels(dicom_file)), None
+    except Exception as e:
+        return dicom_file, None, str(e)
+
+
+def drain(in_queue: queue.Queue) -> None:
+    """
+    Discard items up to the end of a stream, so a failed stage does not leave
+    the stage before it blocked on a full queue.
+    """
+    while in_queue.get() is not _DONE:
+        pass
+
+
+def convert_stage(
+    dicom_files: list[str],
+    out_queue: queue.Queue,
+    max_workers: int | None,
+    max_in_flight: int,
+) -> None:
+    """
+    Decode DICOM files on a process pool and stream the pixels downstream.
+
+    At most max_in_flight files are submitted ahead of the consumer, so
+    decoded images never pile up in memory.
+    """
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            pending = deque()
+            for dicom_file in dicom_files:
+                pending.append(executor.submit(decode_dicom, dicom_file))
+                if len(pending) >= max_in_flight:
+                    out_queue.put(pending.popleft().result())
+            while pending:
+                out_queue.put(pending.popleft().result())
+    finally:
+        # Always close the stream so downstream stages cannot hang
+        out_queue.put(_DONE)
+
+
+def route_stage(
+    in_queue: queue.Queue, out_queue: queue.Queue, labels: dict[str, int]
+) -> None:
+    """
+    Attach the patient label to every decoded image, dropping failures.
+    """
+    try:
+        while True:
+            item = in_queue.get()
+            if item is _DONE:
+                break
+
+            dicom_file, data, error = item
+            if data is None:
+                print(f"Failed to convert {dicom_file}. Reason: {error}")
+                continue
+
+            patient_id = os.path.splitext(os.path.basename(dicom_file))[0]
+            if patient_id in labels:
+                out_queue.put((patient_id, data))
+    except BaseException:
+        drain(in_queue)
+        raise
+    finally:
+        # Always close the stream so downstream stages cannot hang
+        out_queue.put(_DONE)
+
+
+def split_stage(
+    in_queue: queue.Queue,
+    out_queue: queue.Queue,
+    plan: dict[str, tuple[str, str, str]],
+    output_dir: str,
+    consumers: int,
+) -> None:
+    """
+    Assign each labelled image its split and output path.
+    """
+    try:
+        while True:
+            item = in_queue.get()
+            if item is _DONE:
+                break
+
+            patient_id, data = item
+            if patient_id in plan:
+                split, class_name, filename = plan[patient_id]
+                output_file = os.path.join(output_dir, split, class_name, filename)
+                out_queue.put((data, output_file))
+    except BaseException:
+        drain(in_queue)
+        raise
+    finally:
+        for _ in range(consumers):
+            out_queue.put(_DONE)
+
+
+def resize_stage(
+    in_queue: queue.Queue, written: list[str], target_size: int, crop_size: int
+) -> None:
+    """
+    Resize, crop and save images as they arrive.
+    """
+    while True:
+        item = in_queue.get()
+        if item is _DONE:
+            break
+
+        data, output_file = item
+        try:
+            img = resize_and_crop(Image.fromarray(data), target_size, crop_size)
+            img.save(output_file, "JPEG")
+            written.append(output_file)
+            print(f"Processed {output_file}")
+        except Exception as e:
+            print(f"Failed to write {output_file}. Reason: {e}")
+
+
+def run_pipeline(
+    dicom_dir: str,
+    labels_csv: str,
+    output_dir: str,
+    seed: int = SEED,
+    max_workers: int | None = None,
+    resize_workers: int = 4,
+    queue_size: int = 64,
+    target_size: int = 256,
+    crop_size: int = 224,
+) -> list[str]:
+    """
+    Stream RSNA DICOMs through convert, label-route, split-assign and resize.
+
+    Each stage runs concurrently and hands work to the next through a
+    bounded queue, so resized images are written while the rest are still
+    decoding and wall-clock time follows the slowest stage.
+
+    Args:
+        dicom_dir (str): Path to the directory containing DICOM files.
+        labels_csv (str): Path to the RSNA label CSV.
+        output_dir (str): Root of the resized dataset (split/class subfolders).
+        seed (int): Seed for the train/test split.
+        max_workers (int, optional): Decoding processes, all cores by default.
+        resize_workers (int): Number of resize threads.
+        queue_size (int): Capacity of each queue between stages.
+        target_size (int): Size to resize the image to.
+        crop_size (int): Size to crop the center of the image.
+
+    Returns:
+        list: Paths of the images written.
+    """
+    dicom_files = {
+        os.path.splitext(os.path.basename(dicom_file))[0]: dicom_file
+        for dicom_file, _ in list_dicom_jobs(dicom_dir, "")
+    }
+    # Only patients with an image are ranked, as in the renamed directories
+    # the default pipeline samples from
+    labels = {
+        patient_id: target
+        for patient_id, target in load_rsna_labels(labels_csv).items()
+        if patient_id in dicom_files
+    }
+    plan = plan_rsna_split(labels, seed)
+    for split, class_name, _ in set(plan.values()):
+        os.makedirs(os.path.join(output_dir, split, class_name), exist_ok=True)
+
+    # Unselected patients are dropped before decoding, not after
+    dicom_files = [
+        dicom_file
+        for patient_id, dicom_file in sorted(dicom_files.items())
+        if patient_id in plan
+    ]
+
+    decoded = queue.Queue(maxsize=queue_size)
+    routed = queue.Queue(maxsize=queue_size)
+    assigned = queue.Queue(maxsize=queue_size)
+    written = []
+
+    errors = []
+
+    def run_stage(stage, *args) -> None:
+        try:
+            stage(*args)
+        except Exception as e:
+            errors.append(e)
+            raise
+
+    threads = [
+        threading.Thread(
+            target=run_stage,
+            args=(convert_stage, dicom_files, decoded, max_workers, queue_size),
+        ),
+        threading.Thread(target=run_stage, args=(route_stage, decoded, routed, labels)),
+        threading.Thread(
+            target=run_stage,
+            args=(split_stage, routed, assigned, plan, output_dir, resize_workers),
+        ),
+    ]
+    threads += [
+        threading.Thread(
+            target=run_stage,
+            args=(resize_stage, assigned, written, target_size, crop_size),
+        )
+        for _ in range(resize_workers)
+    ]
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise RuntimeError(f"{len(errors)} pipeline stages failed") from errors[0]
+
+    print(f"Wrote {len(written)}/{len(plan)} planned images to {output_dir}")
+    return written
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Stream RSNA DICOMs straight into the resized dataset."
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--resize-workers", type=int, default=4)
+    parser.add_argument("--queue-size", type=int, default=64)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    run_pipeline(
+        RSNA_IMAGES_PATH,
+        LABELS_CSV,
+        RESIZED_PATH,
+        max_workers=args.workers,
+        resize_workers=args.resize_workers,
+        queue_size=args.queue_size,
+    )
+
+
+if __name__ == "__main__":
+    main()
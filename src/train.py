@@ -0,0 +1,399 @@
+import argparse
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from torch.utils.data import DataLoader, Dataset, Subset
+from loader import SEED, load_split, make_loader
+from models import CNNModel, build_resnet50
+from utils.split import CLASS_NAMES, sample_keys
+
+MODELS_PATH = "./models"
+
+
+def build_training(name: str, lr: float | None = None) -> tuple:
+    """
+    Build a model with the optimizer and scheduler the notebook trains it with.
+
+    ResNet50 is fine-tuned from ImageNet weights with SGD and a step decay of
+    0.1 every 7 epochs; CNNModel is trained from scratch with Adam.
+
+    Args:
+        name (str): "resnet50" or "cnn".
+        lr (float, optional): Learning rate, 0.001 by default.
+
+    Returns:
+        tuple: (model, optimizer, scheduler or None).
+    """
+    lr = lr or 0.001
+    if name == "resnet50":
+        model = build_resnet50(pretrained=True)
+        optimizer = optim.SGD(model.parameters(), lr=lr, momentum=0.9)
+        scheduler = optim.lr_scheduler.StepLR(optimizer, step_size=7, gamma=0.1)
+        return model, optimizer, scheduler
+    if name == "cnn":
+        model = CNNModel()
+        return model, optim.Adam(model.parameters(), lr=lr), None
+    raise ValueError(f"Unknown model {name!r}, expected 'resnet50' or 'cnn'")
+
+
+def sample_names(dataset: Dataset) -> list[str]:
+    """
+    Name every sample as class/file, the same for image folders and shards.
+    """
+    if hasattr(dataset, "files"):
+        paths = dataset.files
+    else:
+        paths = [path for path, _ in dataset.samples]
+    return ["/".join(path.replace(os.sep, "/").split("/")[-2:]) for path in paths]
+
+
+def split_validation(
+    dataset: Dataset, fraction: float, seed: int = SEED
+) -> tuple[Subset, Subset]:
+    """
+    Hold out a stratified, seeded fraction of a training set for validation.
+
+    Images are picked by name with sample_keys, so the same images are held
+    out on every run and on resume, whichever way the split is stored.
+
+    Args:
+        dataset (Dataset): Training dataset with targets.
+        fraction (float): Fraction of each class to hold out.
+        seed (int): Seed of the selection.
+
+    Returns:
+        tuple: (training subset, validation subset).
+    """
+    names = sample_names(dataset)
+    index = {name: i for i, name in enumerate(names)}
+    held_out = set()
+    for target in CLASS_NAMES:
+        class_names = [name for name, t in zip(names, dataset.targets) if t == target]
+        count = round(len(class_names) * fraction)
+        held_out.update(index[name] for name in sample_keys(class_names, count, seed))
+
+    train_indices = [i for i in range(len(dataset)) if i not in held_out]
+    return Subset(dataset, train_indices), Subset(dataset, sorted(held_out))
+
+
+def state_to_cpu(state):
+    """
+    Copy the tensors of a (nested) state dict, so training can keep updating
+    the originals while the copy is written out.
+    """
+    if isinstance(state, torch.Tensor):
+        return state.detach().to("cpu", copy=True)
+    if isinstance(state, dict):
+        return {key: state_to_cpu(value) for key, value in state.items()}
+    if isinstance(state, list):
+        return [state_to_cpu(value) for value in state]
+    return state
+
+
+class AsyncCheckpointer:
+    """
+    Writes checkpoints from a background thread.
+
+    The state is snapshotted synchronously, then serialized and written to a
+    temporary file that replaces the target, so an interrupted write never
+    leaves a truncated checkpoint. One write is in flight at a time.
+    """
+
+    def __init__(self) -> None:
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending: Future | None = None
+
+    def save(self, state: dict, path: str) -> None:
+        self.wait()
+        self.pending = self.executor.submit(self.write, state_to_cpu(state), path)
+
+    @staticmethod
+    def write(state: dict, path: str) -> None:
+        tmp_path = path + ".tmp"
+        torch.save(state, tmp_path)
+        os.replace(tmp_path, path)
+
+    def wait(self) -> None:
+        if self.pending is not None:
+            self.pending.result()
+            self.pending = None
+
+    def close(self) -> None:
+        self.wait()
+        self.executor.shutdown()
+
+
+def train_epoch(
+    model: nn.Module,
+    loader: DataLoader,
+    criterion: nn.Module,
+    optimizer: optim.Optimizer,
+    device: torch.device,
+    bf16: bool = False,
+    accumulation_steps: int = 1,
+    log_every: int = 0,
+) -> dict:
+    """
+    Train for one epoch, accumulating gradients over several batches.
+
+    Args:
+        model (nn.Module): Model to train.
+        loader (DataLoader): Training loader.
+        criterion (nn.Module): Loss function.
+        optimizer (optim.Optimizer): Optimizer, stepped every
+            accumulation_steps batches and after the last batch.
+        device (torch.device): Device to train on.
+        bf16 (bool): Run the forward pass under bfloat16 autocast. bfloat16
+            keeps the fp32 exponent range, so no gradient scaling is needed.
+        accumulation_steps (int): Batches per optimizer step.
+        log_every (int): Print throughput every this many batches; 0 to
+            only report the epoch.
+
+    Returns:
+        dict: Loss, accuracy, samples/sec, data wait and compute seconds.
+    """
+    model.train()
+    autocast = (
+        torch.autocast(device.type, dtype=torch.bfloat16) if bf16 else nullcontext()
+    )
+    total_loss = 0.0
+    corrects = 0
+    samples = 0
+    data_time = 0.0
+    compute_time = 0.0
+    num_batches = len(loader)
+
+    optimizer.zero_grad(set_to_none=True)
+    start = time.perf_counter()
+    for step, (inputs, labels) in enumerate(loader, start=1):
+        loaded = time.perf_counter()
+        data_time += loaded - start
+
+        inputs = inputs.to(device, memory_format=torch.channels_last)
+        labels = labels.to(device)
+        with autocast:
+            outputs = model(inputs)
+            loss = criterion(outputs, labels)
+        (loss / accumulation_steps).backward()
+        if step % accumulation_steps == 0 or step == num_batches:
+            optimizer.step()
+            optimizer.zero_grad(set_to_none=True)
+
+        total_loss += loss.item() * inputs.size(0)
+        corrects += (outputs.argmax(dim=1) == labels).sum().item()
+        samples += inputs.size(0)
+        start = time.perf_counter()
+        compute_time += start - loaded
+
+        if log_every and step % log_every == 0:
+            print(
+                f"  step {step}/{num_batches}: loss {total_loss / samples:.4f}, "
+                f"{samples / (data_time + compute_time):.1f} samples/s"
+            )
+
+    return {
+        "loss": total_loss / samples,
+        "acc": corrects / samples,
+        "samples_per_sec": samples / (data_time + compute_time),
+        "data_time": data_time,
+        "compute_time": compute_time,
+    }
+
+
+def evaluate(
+    model: nn.Module,
+    loader: DataLoader,
+    criterion: nn.Module,
+    device: torch.device,
+    bf16: bool = False,
+) -> dict:
+    """
+    Compute loss, accuracy and the confusion matrix (rows are true classes).
+    """
+    model.eval()
+    autocast = (
+        torch.autocast(device.type, dtype=torch.bfloat16) if bf16 else nullcontext()
+    )
+    total_loss = 0.0
+    samples = 0
+    confusion = np.zeros((len(CLASS_NAMES), len(CLASS_NAMES)), dtype=int)
+
+    with torch.inference_mode(), autocast:
+        for inputs, labels in loader:
+            inputs = inputs.to(device, memory_format=torch.channels_last)
+            labels = labels.to(device)
+            outputs = model(inputs)
+            total_loss += criterion(outputs, labels).item() * inputs.size(0)
+            samples += inputs.size(0)
+            np.add.at(
+                confusion,
+                (labels.cpu().numpy(), outputs.argmax(dim=1).cpu().numpy()),
+                1,
+            )
+
+    return {
+        "loss": total_loss / samples,
+        "acc": float(np.trace(confusion)) / samples,
+        "confusion": confusion,
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Train the ResNet50 or CNNModel classifier on the resized data."
+    )
+    parser.add_argument("--model", choices=["resnet50", "cnn"], default="resnet50")
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--lr", type=float, default=None)
+    parser.add_argument(
+        "--accumulation-steps",
+        type=int,
+        default=1,
+        help="Batches per optimizer step; the effective batch is their product.",
+    )
+    parser.add_argument(
+        "--bf16", action="store_true", help="bfloat16 autocast for forward passes."
+    )
+    parser.add_argument("--val-fraction", type=float, default=0.1)
+    parser.add_argument(
+        "--patience",
+        type=int,
+        default=3,
+        help="Stop after this many epochs without a better validation accuracy.",
+    )
+    parser.add_argument("--output-dir", default=MODELS_PATH)
+    parser.add_argument(
+        "--checkpoint-every",
+        type=int,
+        default=1,
+        help="In epochs; epochs that improve the best model are always saved.",
+    )
+    parser.add_argument("--resume", action="store_true")
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--log-every", type=int, default=0, help="In batches.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(SEED)
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    os.makedirs(args.output_dir, exist_ok=True)
+    checkpoint_path = os.path.join(args.output_dir, f"{args.model}_checkpoint.pt")
+    best_path = os.path.join(args.output_dir, f"{args.model}_best.pt")
+
+    train_set, val_set = split_validation(load_split("train"), args.val_fraction)
+    train_loader = make_loader(
+        train_set, batch_size=args.batch_size, num_workers=args.workers
+    )
+    val_loader = make_loader(val_set, batch_size=args.batch_size, shuffle=False)
+    test_loader = make_loader(
+        load_split("test"), batch_size=args.batch_size, shuffle=False
+    )
+    print(
+        f"{len(train_set)} training, {len(val_set)} validation and "
+        f"{len(test_loader.dataset)} test images"
+    )
+
+    model, optimizer, scheduler = build_training(args.model, args.lr)
+    model = model.to(device, memory_format=torch.channels_last)
+    criterion = nn.CrossEntropyLoss()
+
+    start_epoch = 0
+    best_acc = 0.0
+    stale_epochs = 0
+    if args.resume and os.path.exists(checkpoint_path):
+        # The generator state must stay on the CPU; load_state_dict copies the
+        # model and optimizer tensors onto the parameters' device
+        checkpoint = torch.load(checkpoint_path, map_location="cpu", weights_only=True)
+        model.load_state_dict(checkpoint["model"])
+        optimizer.load_state_dict(checkpoint["optimizer"])
+        if scheduler is not None:
+            scheduler.load_state_dict(checkpoint["scheduler"])
+        train_loader.generator.set_state(checkpoint["generator"])
+        start_epoch = checkpoint["epoch"]
+        best_acc = checkpoint["best_acc"]
+        stale_epochs = checkpoint["stale_epochs"]
+        print(f"Resumed from {checkpoint_path} after epoch {start_epoch}")
+    elif os.path.exists(best_path):
+        # A best model left by an earlier run would be tested in place of this one
+        os.remove(best_path)
+
+    checkpointer = AsyncCheckpointer()
+    try:
+        for epoch in range(start_epoch, args.epochs):
+            train = train_epoch(
+                model,
+                train_loader,
+                criterion,
+                optimizer,
+                device,
+                args.bf16,
+                args.accumulation_steps,
+                args.log_every,
+            )
+            # Decay the learning rate after the epoch's optimizer steps
+            if scheduler is not None:
+                scheduler.step()
+            val = evaluate(model, val_loader, criterion, device, args.bf16)
+
+            print(
+                f"Epoch {epoch + 1}/{args.epochs}: "
+                f"train loss {train['loss']:.4f} acc {train['acc']:.4f}, "
+                f"val loss {val['loss']:.4f} acc {val['acc']:.4f}, "
+                f"{train['samples_per_sec']:.1f} samples/s "
+                f"(data {train['data_time']:.1f}s, compute {train['compute_time']:.1f}s)"
+            )
+
+            improved = val["acc"] > best_acc
+            if improved:
+                best_acc = val["acc"]
+                stale_epochs = 0
+                checkpointer.save(model.state_dict(), best_path)
+            else:
+                stale_epochs += 1
+
+            # A resume restores best_acc from here, so it must never lag behind
+            # the model in best_path
+            stopping = stale_epochs >= args.patience
+            if (epoch + 1) % args.checkpoint_every == 0 or stopping or improved:
+                checkpointer.save(
+                    {
+                        "model": model.state_dict(),
+                        "optimizer": optimizer.state_dict(),
+                        "scheduler": scheduler.state_dict() if scheduler else None,
+                        "generator": train_loader.generator.get_state(),
+                        "epoch": epoch + 1,
+                        "best_acc": best_acc,
+                        "stale_epochs": stale_epochs,
+                    },
+                    checkpoint_path,
+                )
+            if stopping:
+                print(f"No improvement for {stale_epochs} epochs, stopping early")
+                break
+    finally:
+        checkpointer.close()
+
+    if os.path.exists(best_path):
+        model.load_state_dict(
+            torch.load(best_path, map_location=device, weights_only=True)
+        )
+    test = evaluate(model, test_loader, criterion, device, args.bf16)
+    print(f"Best validation accuracy: {best_acc:.4f}")
+    print(f"Test loss {test['loss']:.4f} acc {test['acc']:.4f}")
+    print(f"Confusion matrix (rows true {list(CLASS_NAMES.values())}):")
+    print(test["confusion"])
+
+
+if __name__ == "__main__":
+    main()
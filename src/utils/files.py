@@ -1,21 +1,25 @@
+import errno
 import os
 import shutil
 import pandas as pd
-import random
 from concurrent.futures import ThreadPoolExecutor
+from utils.split import sample_keys
 
 
-def clear_data_directory(data_path: str, keep: str) -> None:
+def clear_data_directory(data_path: str, keep: str | tuple[str, ...]) -> None:
     """
     Clears all data except from keep string
 
     Args:
         data_path (str): The path that will be cleared.
-        keep (str): Data to keep.
+        keep (str | tuple): Data to keep, a single name or several names.
     """
+    if isinstance(keep, str):
+        keep = (keep,)
+
     for item in os.listdir(data_path):
         item_path = os.path.join(data_path, item)
-        if item != keep:
+        if item not in keep:
             try:
                 if os.path.isfile(item_path) or os.path.islink(item_path):
                     os.unlink(item_path)
@@ -26,21 +30,44 @@ def clear_data_directory(data_path: str, keep: str) -> None:
                 print(f"Failed to delete {item_path}. Reason: {e}")
 
 
-def copy_image(patient_id: str, target: int, input_dir: str, output_dir: str) -> None:
+def label_paths(
+    patient_id: str, target: int, input_dir: str, output_dir: str
+) -> tuple[str, str]:
     """
-    Copy images based on the target label to appropriate folders.
+    Compute the source image and labelled destination for a patient.
 
     Args:
         patient_id (str): Patient ID.
         target (int): Target label (1 for pneumonia, 0 for normal).
         input_dir (str): Path to the input directory containing images.
         output_dir (str): Path to the output directory to save copied images.
+
+    Returns:
+        tuple: (input_file, output_file) paths.
     """
     input_file = os.path.join(input_dir, f"{patient_id}.jpeg")
-    if target == 1:
-        output_folder = os.path.join(output_dir, "pneumonia")
-    else:
-        output_folder = os.path.join(output_dir, "normal")
+    label = "pneumonia" if target == 1 else "normal"
+    output_file = os.path.join(output_dir, label, f"{patient_id}.jpeg")
+    return input_file, output_file
+
+
+def copy_image(
+    patient_id: str, target: int, input_dir: str, output_dir: str
+) -> str | None:
+    """
+    Copy images based on the target label to appropriate folders.
+
+    Args:
+        patient_id (str): Patient ID.
+        target (int): Target label (1 for pneumonia, 0 for normal).
+        input_dir (str): Path to the input directory containing images.
+        output_dir (str): Path to the output directory to save copied images.
+
+    Returns:
+        str | None: The input file if it was copied, None if it was missing.
+    """
+    input_file, output_file = label_paths(patient_id, target, input_dir, output_dir)
+    output_folder = os.path.dirname(output_file)
 
     if not os.path.exists(output_folder):
         try:
@@ -49,13 +76,81 @@ def copy_image(patient_id: str, target: int, input_dir: str, output_dir: str) ->
             # In case of a race condition where the directory was created by another thread
             pass
 
-    output_file = os.path.join(output_folder, f"{patient_id}.jpeg")
-
     if os.path.exists(input_file):
-        shutil.copy(input_file, output_file)
+        link_or_copy(input_file, output_file)
         print(f"Copied {input_file} to {output_file}")
-    else:
-        print(f"File {input_file} not found.")
+        return input_file
+
+    print(f"File {input_file} not found.")
+    return None
+
+
+def reflink(src: str, dst: str) -> None:
+    """
+    Create a copy-on-write clone of a file (Linux FICLONE, e.g. Btrfs or XFS).
+
+    Args:
+        src (str): Path to the source file.
+        dst (str): Path to the clone to create.
+
+    Raises:
+        OSError: If the platform or filesystem does not support reflinks.
+    """
+    import fcntl
+
+    ficlone = 0x40049409
+    with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+        try:
+            fcntl.ioctl(dst_file.fileno(), ficlone, src_file.fileno())
+        except OSError:
+            dst_file.close()
+            os.remove(dst)
+            raise
+
+
+def link_or_copy(src: str, dst: str) -> str:
+    """
+    Place src at dst without copying data when the filesystem allows it.
+
+    Tries a hardlink, then a reflink, and falls back to a regular copy.
+    An existing dst is replaced, like shutil.copy.
+
+    Args:
+        src (str): Path to the source file.
+        dst (str): Path to the destination file.
+
+    Returns:
+        str: The method used, "link", "reflink" or "copy".
+    """
+    if os.path.lexists(dst):
+        os.remove(dst)
+
+    try:
+        os.link(src, dst)
+        return "link"
+    except OSError:
+        pass
+
+    try:
+        reflink(src, dst)
+        return "reflink"
+    except (OSError, ImportError):
+        shutil.copy(src, dst)
+        return "copy"
+
+
+def chunked(items: list, chunk_size: int) -> list[list]:
+    """
+    Split a list into consecutive chunks, e.g. to hand one to each worker.
+
+    Args:
+        items (list): Items to split.
+        chunk_size (int): Maximum number of items per chunk.
+
+    Returns:
+        list: The chunks, in order; only the last one may be shorter.
+    """
+    return [items[i : i + chunk_size] for i in range(0, len(items), chunk_size)]
 
 
 def delete_directory(directory: str) -> None:
@@ -73,10 +168,16 @@ def delete_directory(directory: str) -> None:
 
 
 def process_csv(
-    csv_file: str, input_dir: str, output_dir: str, max_workers: int = 12
+    csv_file: str,
+    input_dir: str,
+    output_dir: str,
+    max_workers: int = 12,
 ) -> None:
     """
-    Process the CSV file and copy images concurrently.
+    Process the CSV file and link or copy images concurrently.
+
+    The label CSV has one row per bounding box, so rows are first collapsed
+    to one target per patient and every image is routed exactly once.
 
     Args:
         csv_file (str): Path to the CSV file containing patientId and target columns.
@@ -84,19 +185,83 @@ def process_csv(
         output_dir (str): Path to the output directory to save copied images.
         max_workers (int): Maximum number of threads to use.
     """
-    df = pd.read_csv(csv_file)
+    df = pd.read_csv(csv_file, usecols=["patientId", "Target"])
+    targets = df.groupby("patientId")["Target"].max()
+
+    jobs = [
+        label_paths(patient_id, target, input_dir, output_dir)
+        for patient_id, target in targets.items()
+    ]
+
+    for output_folder in {os.path.dirname(output_file) for _, output_file in jobs}:
+        os.makedirs(output_folder, exist_ok=True)
+
+    missing = [src for src, _ in jobs if not os.path.exists(src)]
+    for src in missing:
+        print(f"File {src} not found.")
+    jobs = [job for job in jobs if os.path.exists(job[0])]
 
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [
-            executor.submit(
-                copy_image, row["patientId"], row["Target"], input_dir, output_dir
-            )
-            for _, row in df.iterrows()
-        ]
+        methods = list(executor.map(lambda job: link_or_copy(*job), jobs))
+
+    counts = {method: methods.count(method) for method in set(methods)}
+    print(
+        f"Routed {len(jobs)} of {len(df)} label rows to {output_dir} "
+        f"({len(targets)} patients, {len(missing)} missing images, {counts})"
+    )
+
+
+def scan_files(directory: str) -> list[str]:
+    """
+    List the regular files in a directory with a single scan.
+
+    os.scandir reports the entry type from the directory listing itself,
+    so no per-file stat call is needed on most filesystems.
+
+    Args:
+        directory (str): Path to the directory to scan.
 
-        # Ensure all threads complete
-        for future in futures:
-            future.result()
+    Returns:
+        list: Names of the files, in directory order.
+    """
+    with os.scandir(directory) as entries:
+        return [entry.name for entry in entries if entry.is_file()]
+
+
+def apply_moves(moves: list[tuple[str, str]]) -> None:
+    """
+    Execute a batch of planned moves and log a single summary.
+
+    Each move is a rename; only moves across devices fall back to
+    shutil.move, which copies the data.
+
+    Args:
+        moves (list): List of (source, destination) paths.
+    """
+    renamed = 0
+    copied = 0
+    for src_file, dest_file in moves:
+        try:
+            os.replace(src_file, dest_file)
+            # rename is a no-op when both names are hard links to one file,
+            # e.g. a linked label copy moved onto the same image kept from an
+            # earlier incremental run
+            if src_file != dest_file and os.path.lexists(src_file):
+                os.remove(src_file)
+            renamed += 1
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            shutil.move(src_file, dest_file)
+            copied += 1
+
+    if moves:
+        src_dir = os.path.dirname(moves[0][0])
+        dest_dir = os.path.dirname(moves[0][1])
+        print(
+            f"Moved {len(moves)} files from {src_dir} to {dest_dir} "
+            f"({renamed} renamed, {copied} copied across devices)"
+        )
 
 
 def sort_and_rename_files(directory: str) -> None:
@@ -106,27 +271,36 @@ def sort_and_rename_files(directory: str) -> None:
     Args:
         directory (str): Path to the directory to organize files.
     """
-    # List all files in the directory
-    files = [
-        f for f in os.listdir(directory) if os.path.isfile(os.path.join(directory, f))
-    ]
+    files = sorted(scan_files(directory))
 
-    # Sort files alphabetically
-    files.sort()
+    renames = [
+        (os.path.join(directory, filename), os.path.join(directory, f"{i:04d}.jpeg"))
+        for i, filename in enumerate(files, start=1)
+    ]
+    renames = [
+        (old_file, new_file) for old_file, new_file in renames if old_file != new_file
+    ]
 
-    # Rename files in order
-    for i, filename in enumerate(files, start=1):
-        # Define the new filename
-        new_filename = f"{i:04d}.jpeg"
-        old_file = os.path.join(directory, filename)
-        new_file = os.path.join(directory, new_filename)
+    # A target that is still the name of a pending source would be clobbered,
+    # so such batches go through temporary names first
+    sources = {old_file for old_file, _ in renames}
+    if any(new_file in sources for _, new_file in renames):
+        staged = [
+            (old_file, os.path.join(directory, f".renaming_{i}"))
+            for i, (old_file, _) in enumerate(renames)
+        ]
+        apply_moves(staged)
+        renames = [
+            (tmp_file, new_file)
+            for (_, tmp_file), (_, new_file) in zip(staged, renames)
+        ]
 
-        # Rename the file
-        os.rename(old_file, new_file)
-        print(f"Renamed {old_file} to {new_file}")
+    apply_moves(renames)
 
 
-def move_files(src_dir: str, dest_dir: str, dest_prefix: str = "") -> None:
+def move_files(
+    src_dir: str, dest_dir: str, dest_prefix: str = ""
+) -> list[tuple[str, str]]:
     """
     Move all files from the source directory to the destination directory.
 
@@ -134,17 +308,22 @@ def move_files(src_dir: str, dest_dir: str, dest_prefix: str = "") -> None:
         src_dir (str): Path to the source directory.
         dest_dir (str): Path to the destination directory.
         dest_prefix (str): String to append before the filename in the destine.
+
+    Returns:
+        list: The (source, destination) paths moved.
     """
     if not os.path.exists(dest_dir):
         os.makedirs(dest_dir)
 
-    for filename in os.listdir(src_dir):
-        src_file = os.path.join(src_dir, filename)
-        dest_file = os.path.join(dest_dir, dest_prefix + filename)
-
-        if os.path.isfile(src_file):
-            shutil.move(src_file, dest_file)
-            print(f"Moved {src_file} to {dest_file}")
+    moves = [
+        (
+            os.path.join(src_dir, filename),
+            os.path.join(dest_dir, dest_prefix + filename),
+        )
+        for filename in sorted(scan_files(src_dir))
+    ]
+    apply_moves(moves)
+    return moves
 
 
 def move_random_files(
@@ -153,36 +332,40 @@ def move_random_files(
     num_files: int,
     seed: int | None = None,
     dest_prefix: str = "",
-) -> None:
+) -> list[tuple[str, str]]:
     """
     Move a specified number of random files from the source directory to the destination directory.
 
+    Files are picked with utils.split.sample_keys, which ranks file names by a
+    seeded hash. The choice does not depend on directory order or on the
+    global random state. Repeated calls with the same seed on the same
+    directory continue the same ranking, so their picks never overlap.
+
     Args:
         src_dir (str): Path to the source directory.
         dest_dir (str): Path to the destination directory.
         num_files (int): Number of random files to move.
-        seed (int, optional): Seed for the random number generator.
+        seed (int, optional): Seed of the selection.
         dest_prefix (str): String to append before the filename in the destine.
-    """
-    if seed is not None:
-        random.seed(seed)
 
+    Returns:
+        list: The (source, destination) paths moved.
+    """
     if not os.path.exists(dest_dir):
         os.makedirs(dest_dir)
 
-    # List all files in the source directory
-    files = [f for f in os.listdir(src_dir) if os.path.isfile(os.path.join(src_dir, f))]
-
     # Select a random subset of files
-    random_files = random.sample(files, min(num_files, len(files)))
-
-    # Move each file to the destination directory
-    for filename in random_files:
-        src_file = os.path.join(src_dir, filename)
-        dest_file = os.path.join(dest_dir, dest_prefix + filename)
-
-        shutil.move(src_file, dest_file)
-        print(f"Moved {src_file} to {dest_file}")
+    random_files = sample_keys(scan_files(src_dir), num_files, seed)
+
+    moves = [
+        (
+            os.path.join(src_dir, filename),
+            os.path.join(dest_dir, dest_prefix + filename),
+        )
+        for filename in random_files
+    ]
+    apply_moves(moves)
+    return moves
 
 
 def main() -> None:
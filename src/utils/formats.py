@@ -0,0 +1,128 @@
+from typing import NamedTuple
+import numpy as np
+from PIL import Image
+
+# File extension written for each output format
+EXTENSIONS = {"jpeg": ".jpeg", "png": ".png", "webp": ".webp", "npy": ".npy"}
+
+# Pillow's own JPEG defaults, used when no quality is configured
+DEFAULT_QUALITY = 75
+
+
+class OutputFormat(NamedTuple):
+    """
+    How resized images are encoded.
+
+    Attributes:
+        format (str): "jpeg", "png" (lossless), "webp" (lossless; WebP has no
+            single-channel mode, so images decode as RGB) or "npy" (raw uint8
+            array, no encoding at all).
+        grayscale (bool): Store a single L channel. The radiographs are
+            grayscale, so this cuts bytes and encode time at no loss.
+        quality (int): JPEG quality, 1-95.
+        subsampling (int, optional): JPEG chroma subsampling, 0 (4:4:4),
+            1 (4:2:2) or 2 (4:2:0); Pillow's default when None. Ignored for
+            grayscale images, which have no chroma.
+    """
+
+    format: str = "jpeg"
+    grayscale: bool = False
+    quality: int = DEFAULT_QUALITY
+    subsampling: int | None = None
+
+    @property
+    def extension(self) -> str:
+        return EXTENSIONS[self.format]
+
+    @property
+    def tag(self) -> str:
+        """
+        Short name of the format, used to key manifest stages.
+        """
+        tag = self.format + ("_L" if self.grayscale else "")
+        if self.format == "jpeg":
+            tag += f"_q{self.quality}"
+            if self.subsampling is not None:
+                tag += f"_s{self.subsampling}"
+        return tag
+
+    def is_plain_jpeg(self, img: Image.Image) -> bool:
+        """
+        Check whether saving img would just re-encode it as the JPEG it already is.
+        """
+        return (
+            self.format == "jpeg"
+            and self.quality == DEFAULT_QUALITY
+            and self.subsampling is None
+            and (not self.grayscale or img.mode == "L")
+        )
+
+
+def parse_output_format(spec: str) -> OutputFormat:
+    """
+    Build an OutputFormat from a command line spec.
+
+    The spec is a format name optionally followed by comma-separated options,
+    e.g. "png,gray", "jpeg,gray,q90" or "jpeg,q95,s0".
+
+    Args:
+        spec (str): The format spec.
+
+    Returns:
+        OutputFormat: The parsed format.
+    """
+    name, *options = spec.lower().split(",")
+    if name not in EXTENSIONS:
+        raise ValueError(f"Unknown format {name!r}, expected one of {list(EXTENSIONS)}")
+
+    output_format = OutputFormat(name)
+    for option in options:
+        if option in ("gray", "l"):
+            output_format = output_format._replace(grayscale=True)
+        elif option[:1] == "q" and option[1:].isdigit():
+            output_format = output_format._replace(quality=int(option[1:]))
+        elif option[:1] == "s" and option[1:].isdigit():
+            output_format = output_format._replace(subsampling=int(option[1:]))
+        else:
+            raise ValueError(f"Unknown option {option!r} in format {spec!r}")
+    return output_format
+
+
+def save_image(img: Image.Image, output_file: str, output_format: OutputFormat) -> None:
+    """
+    Save an image in the given output format.
+
+    Args:
+        img (Image.Image): Image to save.
+        output_file (str): Path to the output file, with the format's extension.
+        output_format (OutputFormat): How to encode the image.
+    """
+    if output_format.grayscale and img.mode != "L":
+        img = img.convert("L")
+
+    if output_format.format == "jpeg":
+        options = {"quality": output_format.quality}
+        if output_format.subsampling is not None and img.mode != "L":
+            options["subsampling"] = output_format.subsampling
+        img.save(output_file, "JPEG", **options)
+    elif output_format.format == "png":
+        img.save(output_file, "PNG")
+    elif output_format.format == "webp":
+        img.save(output_file, "WEBP", lossless=True)
+    else:
+        np.save(output_file, np.asarray(img))
+
+
+def load_image(path: str) -> Image.Image:
+    """
+    Open an image written by save_image, including raw .npy arrays.
+
+    Args:
+        path (str): Path to the image file.
+
+    Returns:
+        Image.Image: The image.
+    """
+    if path.lower().endswith(".npy"):
+        return Image.fromarray(np.load(path))
+    return Image.open(path)
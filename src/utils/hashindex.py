@@ -0,0 +1,93 @@
+import imagehash
+
+
+def hash_to_int(image_hash: imagehash.ImageHash | str) -> int:
+    """
+    Pack a 64-bit perceptual hash into an integer.
+
+    Args:
+        image_hash (ImageHash | str): Hash object or its hex string.
+
+    Returns:
+        int: The hash bits as an unsigned integer.
+    """
+    return int(str(image_hash), 16)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over packed hashes under the Hamming metric.
+
+    A radius query only descends into children whose edge distance lies
+    within the radius of the query distance (triangle inequality), so
+    lookups with a small threshold touch a small fraction of the tree and a
+    full deduplication pass stays well below n² comparisons.
+    """
+
+    def __init__(self) -> None:
+        # Each node is [hash, item, {distance: child}]
+        self.root = None
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def add(self, value: int, item=None) -> None:
+        """
+        Insert a hash into the tree.
+
+        Args:
+            value (int): Packed hash.
+            item: Payload returned by search, e.g. the image path.
+        """
+        self.size += 1
+        if self.root is None:
+            self.root = [value, item, {}]
+            return
+
+        node = self.root
+        while True:
+            distance = hamming_distance(value, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, item, {}]
+                return
+            node = child
+
+    def search(self, value: int, threshold: int) -> list[tuple[int, object]]:
+        """
+        Find every stored hash within a Hamming distance of value.
+
+        Args:
+            value (int): Packed hash to look up.
+            threshold (int): Maximum Hamming distance (inclusive).
+
+        Returns:
+            list: (distance, item) pairs, closest first.
+        """
+        if self.root is None:
+            return []
+
+        matches = []
+        stack = [self.root]
+        while stack:
+            node_value, item, children = stack.pop()
+            distance = hamming_distance(value, node_value)
+            if distance <= threshold:
+                matches.append((distance, item))
+            for edge, child in children.items():
+                if distance - threshold <= edge <= distance + threshold:
+                    stack.append(child)
+
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+    def contains_near(self, value: int, threshold: int) -> bool:
+        """
+        Check whether any stored hash lies within threshold of value.
+        """
+        return bool(self.search(value, threshold))
@@ -0,0 +1,173 @@
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+import imagehash
+from PIL import Image
+from utils.files import chunked
+
+HASH_ALGORITHMS = {
+    "average": imagehash.average_hash,
+    "perceptual": imagehash.phash,
+    "difference": imagehash.dhash,
+}
+
+# Smallest size requested from the JPEG decoder in draft mode; every
+# algorithm above works on at most 32x32 pixels
+DRAFT_SIZE = (64, 64)
+
+
+def compute_image_hash(
+    image_path: str, algorithm: str = "average", draft: bool = False
+) -> str | None:
+    """
+    Compute a perceptual hash of an image as a hex string.
+
+    Args:
+        image_path (str): Path to the image file.
+        algorithm (str): One of "average", "perceptual" or "difference".
+        draft (bool): Let the JPEG decoder downscale in the DCT domain and
+            decode straight to grayscale. Much faster on large images, but
+            hashes may differ by a few bits from a full decode.
+
+    Returns:
+        str | None: The hash, or None if the image could not be read.
+    """
+    try:
+        with Image.open(image_path) as img:
+            if draft:
+                img.draft("L", DRAFT_SIZE)
+            return str(HASH_ALGORITHMS[algorithm](img))
+    except Exception as e:
+        print(f"Failed to compute hash for {image_path}. Reason: {e}")
+        return None
+
+
+def hash_chunk(image_paths: list[str], algorithm: str, draft: bool) -> list[str | None]:
+    return [compute_image_hash(path, algorithm, draft) for path in image_paths]
+
+
+class HashStore:
+    """
+    On-disk cache of image hashes keyed by path, size and mtime.
+
+    A cached hash is only returned while the file keeps the same size and
+    modification time, so edited or replaced files are rehashed.
+    """
+
+    def __init__(self, db_path: str) -> None:
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS hashes (
+                path TEXT NOT NULL,
+                algorithm TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                hash TEXT NOT NULL,
+                PRIMARY KEY (path, algorithm)
+            )
+            """
+        )
+        self.connection.commit()
+
+    def __enter__(self) -> "HashStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.connection.commit()
+        self.connection.close()
+
+    def get(self, path: str, algorithm: str, stat: os.stat_result) -> str | None:
+        row = self.connection.execute(
+            "SELECT hash FROM hashes WHERE path = ? AND algorithm = ? "
+            "AND size = ? AND mtime_ns = ?",
+            (path, algorithm, stat.st_size, stat.st_mtime_ns),
+        ).fetchone()
+        return row[0] if row else None
+
+    def put(
+        self, path: str, algorithm: str, stat: os.stat_result, image_hash: str
+    ) -> None:
+        self.connection.execute(
+            "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)",
+            (path, algorithm, stat.st_size, stat.st_mtime_ns, image_hash),
+        )
+
+    def commit(self) -> None:
+        self.connection.commit()
+
+
+def hash_images(
+    image_paths: list[str],
+    algorithm: str = "average",
+    draft: bool = True,
+    cache_file: str | None = None,
+    max_workers: int | None = None,
+    chunk_size: int = 32,
+) -> dict[str, str]:
+    """
+    Hash many images in a process pool, reusing cached hashes when possible.
+
+    Args:
+        image_paths (list): Paths of the images to hash.
+        algorithm (str): One of "average", "perceptual" or "difference".
+        draft (bool): Use JPEG draft-mode decoding (see compute_image_hash).
+        cache_file (str, optional): Path to the HashStore database.
+        max_workers (int, optional): Number of processes, all cores by default.
+        chunk_size (int): Number of images handed to a worker at once.
+
+    Returns:
+        dict: Mapping of image path to hex hash; unreadable images are omitted.
+    """
+    if algorithm not in HASH_ALGORITHMS:
+        raise ValueError(
+            f"Unknown algorithm {algorithm!r}, expected one of {list(HASH_ALGORITHMS)}"
+        )
+
+    # Draft hashes can differ from full-decode ones, so they are cached apart
+    cache_key = f"{algorithm}+draft" if draft else algorithm
+    store = HashStore(cache_file) if cache_file else None
+
+    hashes = {}
+    stats = {}
+    pending = []
+    for path in image_paths:
+        try:
+            stats[path] = os.stat(path)
+        except OSError as e:
+            print(f"Failed to compute hash for {path}. Reason: {e}")
+            continue
+
+        cached = store.get(path, cache_key, stats[path]) if store else None
+        if cached is not None:
+            hashes[path] = cached
+        else:
+            pending.append(path)
+
+    reused = len(hashes)
+    chunks = chunked(pending, chunk_size)
+    if chunks:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(
+                hash_chunk, chunks, [algorithm] * len(chunks), [draft] * len(chunks)
+            )
+            for chunk, chunk_hashes in zip(chunks, results):
+                for path, image_hash in zip(chunk, chunk_hashes):
+                    if image_hash is None:
+                        continue
+                    hashes[path] = image_hash
+                    if store:
+                        store.put(path, cache_key, stats[path], image_hash)
+
+    if store:
+        store.close()
+
+    print(f"Hashed {len(pending)} images, reused {reused} cached hashes")
+    return hashes
@@ -1,7 +1,13 @@
+import csv
+import io
 import os
+import threading
 import imagehash
-import shutil
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from PIL import Image
+from utils.files import chunked, link_or_copy
+from utils.hashindex import BKTree, hamming_distance, hash_to_int
+from utils.hashstore import HASH_ALGORITHMS, HashStore, hash_images
 
 
 def is_image_file(file_path):
@@ -42,60 +48,86 @@ def remove_corrupted_images(directory):
                     print(f"Failed to remove corrupted image {file_path}. Reason: {e}")
 
 
-def compute_hash(image_path: str) -> None | imagehash.ImageHash:
+def compute_hash(
+    image_path: str, algorithm: str = "average"
+) -> None | imagehash.ImageHash:
     """
     Compute the perceptual hash of an image.
 
     Args:
         image_path (str): Path to the image file.
+        algorithm (str): One of "average", "perceptual" or "difference".
 
     Returns:
         str: The computed hash of the image.
     """
     try:
         with Image.open(image_path) as img:
-            return imagehash.average_hash(img)
+            return HASH_ALGORITHMS[algorithm](img)
     except Exception as e:
         print(f"Failed to compute hash for {image_path}. Reason: {e}")
         return None
 
 
-def store_hashes(image_paths, hash_file):
+def store_hashes(image_paths, hash_file, algorithm="average", cache_file=None):
     """
     Compute and store hashes of given images in a file.
 
     Args:
         image_paths (list): List of image file paths.
         hash_file (str): Path to the file where hashes will be stored.
+        algorithm (str): One of "average", "perceptual" or "difference".
+        cache_file (str, optional): Path to a hash cache reused across runs.
     """
+    # Full decodes, so the stored hashes match those of filter_dataset
+    hashes = hash_images(image_paths, algorithm, draft=False, cache_file=cache_file)
+
     with open(hash_file, "w") as f:
         for image_path in image_paths:
-            image_hash = compute_hash(image_path)
-            if image_hash:
-                f.write(f"{image_hash}\n")
+            if image_path in hashes:
+                f.write(f"{hashes[image_path]}\n")
                 print(f"Stored hash for {image_path}")
 
 
-def find_and_remove_duplicates(directory: str) -> None:
+def list_files(directory: str) -> list[str]:
+    return [
+        entry.path
+        for entry in sorted(os.scandir(directory), key=lambda entry: entry.name)
+        if entry.is_file()
+    ]
+
+
+def find_and_remove_duplicates(
+    directory: str,
+    threshold: int = 0,
+    algorithm: str = "average",
+    draft: bool = False,
+    cache_file: str | None = None,
+) -> None:
     """
     Find and remove duplicate images in a directory.
 
     Args:
         directory (str): Path to the directory to check for duplicates.
+        threshold (int): Maximum Hamming distance between hashes for two
+            images to count as duplicates (0 for exact matches only).
+        algorithm (str): One of "average", "perceptual" or "difference".
+        draft (bool): Hash from JPEG draft-mode decodes (faster, approximate).
+        cache_file (str, optional): Path to a hash cache reused across runs.
     """
-    hashes = {}
-    duplicates = []
+    file_paths = list_files(directory)
+    hashes = hash_images(file_paths, algorithm, draft, cache_file)
 
-    for filename in os.listdir(directory):
-        file_path = os.path.join(directory, filename)
+    index = BKTree()
+    duplicates = []
 
-        if os.path.isfile(file_path):
-            image_hash = compute_hash(file_path)
-            if image_hash:
-                if image_hash in hashes:
-                    duplicates.append(file_path)
-                else:
-                    hashes[image_hash] = file_path
+    for file_path in file_paths:
+        if file_path in hashes:
+            value = hash_to_int(hashes[file_path])
+            if index.contains_near(value, threshold):
+                duplicates.append(file_path)
+            else:
+                index.add(value, file_path)
 
     for duplicate in duplicates:
         try:
@@ -119,22 +151,52 @@ def load_hashes(hash_file):
         return set(line.strip() for line in f)
 
 
-def is_duplicate(image_path, stored_hashes):
+def load_hash_index(hash_file):
+    """
+    Load hashes from a file into a BK-tree for near-duplicate lookups.
+
+    Args:
+        hash_file (str): Path to the file containing hashes.
+
+    Returns:
+        BKTree: Index of the stored hashes.
+    """
+    index = BKTree()
+    for stored_hash in load_hashes(hash_file):
+        if stored_hash:
+            index.add(hash_to_int(stored_hash), stored_hash)
+    return index
+
+
+def is_duplicate(image_path, stored_hashes, threshold=0):
     """
     Check if an image is a duplicate based on stored hashes.
 
     Args:
         image_path (str): Path to the image file.
-        stored_hashes (set): Set of stored hashes.
+        stored_hashes (set | BKTree): Set of stored hashes, or an index from
+            load_hash_index for near-duplicate matching.
+        threshold (int): Maximum Hamming distance, used with a BKTree.
 
     Returns:
         bool: True if the image is a duplicate, False otherwise.
     """
     image_hash = compute_hash(image_path)
+    if isinstance(stored_hashes, BKTree):
+        if image_hash is None:
+            return False
+        return stored_hashes.contains_near(hash_to_int(image_hash), threshold)
     return str(image_hash) in stored_hashes
 
 
-def filter_dataset(dataset_dir, hash_file, output_dir):
+def filter_dataset(
+    dataset_dir,
+    hash_file,
+    output_dir,
+    threshold=0,
+    algorithm="average",
+    cache_file=None,
+):
     """
     Filter out duplicate images from a dataset.
 
@@ -142,20 +204,272 @@ def filter_dataset(dataset_dir, hash_file, output_dir):
         dataset_dir (str): Path to the dataset directory.
         hash_file (str): Path to the file containing hashes to filter.
         output_dir (str): Path to the directory to save filtered images.
+        threshold (int): Maximum Hamming distance to a stored hash for an
+            image to be filtered out (0 for exact matches only).
+        algorithm (str): Algorithm the hashes in hash_file were computed with.
+        cache_file (str, optional): Path to a hash cache reused across runs.
     """
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    stored_hashes = load_hashes(hash_file)
+    stored_hashes = load_hash_index(hash_file)
 
-    for filename in os.listdir(dataset_dir):
-        file_path = os.path.join(dataset_dir, filename)
-        if os.path.isfile(file_path):
-            if not is_duplicate(file_path, stored_hashes):
-                shutil.copy(file_path, os.path.join(output_dir, filename))
-                print(f"Copied {file_path} to {output_dir}")
-            else:
-                print(f"Filtered out duplicate image: {file_path}")
+    file_paths = list_files(dataset_dir)
+    hashes = hash_images(file_paths, algorithm, draft=False, cache_file=cache_file)
+
+    for file_path in file_paths:
+        image_hash = hashes.get(file_path)
+        if image_hash is None or not stored_hashes.contains_near(
+            hash_to_int(image_hash), threshold
+        ):
+            link_or_copy(
+                file_path, os.path.join(output_dir, os.path.basename(file_path))
+            )
+            print(f"Copied {file_path} to {output_dir}")
+        else:
+            print(f"Filtered out duplicate image: {file_path}")
+
+
+def inspect_image(
+    image_path: str, algorithm: str = "average"
+) -> tuple[str, str | None, str | None]:
+    """
+    Validate and hash an image from a single read of the file.
+
+    Args:
+        image_path (str): Path to the image file.
+        algorithm (str): One of "average", "perceptual" or "difference".
+
+    Returns:
+        tuple: (image_path, hex hash or None, failure reason or None).
+    """
+    try:
+        with open(image_path, "rb") as f:
+            data = f.read()
+
+        # verify() leaves the image unusable, so hashing reopens the same bytes
+        with Image.open(io.BytesIO(data)) as img:
+            img.verify()
+        with Image.open(io.BytesIO(data)) as img:
+            return image_path, str(HASH_ALGORITHMS[algorithm](img)), None
+    except Exception as e:
+        return image_path, None, str(e)
+
+
+def inspect_chunk(image_paths: list[str], algorithm: str) -> list[tuple]:
+    return [inspect_image(image_path, algorithm) for image_path in image_paths]
+
+
+def clean_dataset(
+    dataset_dir: str,
+    hash_file: str,
+    output_dir: str,
+    threshold: int = 0,
+    algorithm: str = "average",
+    cache_file: str | None = None,
+    report_file: str | None = None,
+    max_workers: int | None = None,
+    chunk_size: int = 32,
+) -> list[tuple[str, str, str]]:
+    """
+    Validate, deduplicate and blocklist-filter a dataset in one pass.
+
+    Replaces remove_corrupted_images, find_and_remove_duplicates and
+    filter_dataset run back to back: every image is read once, validated
+    and hashed in a process pool, then checked against the blocklist and
+    the images kept so far. Kept images are linked or copied to output_dir
+    in parallel; the dataset directory itself is left untouched.
+
+    Args:
+        dataset_dir (str): Path to the dataset directory.
+        hash_file (str): Path to the file containing hashes to filter.
+        output_dir (str): Path to the directory to save kept images.
+        threshold (int): Maximum Hamming distance for a blocklist or
+            duplicate match (0 for exact matches only).
+        algorithm (str): One of "average", "perceptual" or "difference".
+        cache_file (str, optional): Path to a hash cache reused across runs.
+            Only images whose hash this function stored, after validating
+            them, skip validation; hashes stored by hash_images do not count.
+        report_file (str, optional): Path to write a CSV of the decisions.
+        max_workers (int, optional): Number of processes, all cores by default.
+        chunk_size (int): Number of images handed to a worker at once.
+
+    Returns:
+        list: (image path, "keep" or "drop", reason) for every file.
+    """
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    blocklist = load_hash_index(hash_file)
+    file_paths = list_files(dataset_dir)
+
+    # hash_images fills the same cache without verify(), so validated hashes
+    # are stored under their own key
+    cache_key = f"{algorithm}+verified"
+    store = HashStore(cache_file) if cache_file else None
+    hashes = {}
+    failures = {}
+    pending = []
+    for file_path in file_paths:
+        cached = store.get(file_path, cache_key, os.stat(file_path)) if store else None
+        if cached is not None:
+            hashes[file_path] = cached
+        else:
+            pending.append(file_path)
+
+    chunks = chunked(pending, chunk_size)
+    if chunks:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for results in executor.map(
+                inspect_chunk, chunks, [algorithm] * len(chunks)
+            ):
+                for file_path, image_hash, reason in results:
+                    if image_hash is None:
+                        failures[file_path] = reason
+                        continue
+                    hashes[file_path] = image_hash
+                    if store:
+                        store.put(file_path, cache_key, os.stat(file_path), image_hash)
+
+    if store:
+        store.close()
+
+    index = BKTree()
+    decisions = []
+    for file_path in file_paths:
+        if file_path in failures:
+            decisions.append((file_path, "drop", f"corrupted: {failures[file_path]}"))
+            continue
+
+        value = hash_to_int(hashes[file_path])
+        blocked = blocklist.search(value, threshold)
+        if blocked:
+            decisions.append((file_path, "drop", f"blocklisted: {blocked[0][1]}"))
+            continue
+
+        duplicate = index.search(value, threshold)
+        if duplicate:
+            decisions.append((file_path, "drop", f"duplicate of {duplicate[0][1]}"))
+            continue
+
+        index.add(value, file_path)
+        decisions.append((file_path, "keep", ""))
+
+    kept = [file_path for file_path, decision, _ in decisions if decision == "keep"]
+    with ThreadPoolExecutor() as executor:
+        list(
+            executor.map(
+                lambda file_path: link_or_copy(
+                    file_path, os.path.join(output_dir, os.path.basename(file_path))
+                ),
+                kept,
+            )
+        )
+
+    if report_file:
+        with open(report_file, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["path", "decision", "reason"])
+            writer.writerows(decisions)
+
+    dropped = [decision for decision in decisions if decision[1] == "drop"]
+    print(
+        f"Kept {len(kept)} of {len(decisions)} images from {dataset_dir} "
+        f"in {output_dir} ({len(dropped)} dropped)"
+    )
+    for file_path, _, reason in dropped:
+        print(f"  Dropped {file_path}: {reason}")
+
+    return decisions
+
+
+class DownloadFilter:
+    """
+    Validates and deduplicates downloaded images before they are written.
+
+    One instance is meant to be shared by all download threads: hashes of
+    accepted images go into a common index, so the same picture found by
+    two searches is only saved once. Images matching the blocklist files
+    are rejected as well.
+
+    An accepted image is only reserved by check; call commit once it is
+    written, or release if writing failed, so a failed write does not block
+    the picture for the rest of the run.
+    """
+
+    def __init__(
+        self,
+        hash_files: tuple[str, ...] = (),
+        threshold: int = 0,
+        min_size: int = 64,
+        algorithm: str = "average",
+    ) -> None:
+        self.threshold = threshold
+        self.min_size = min_size
+        self.algorithm = algorithm
+        self.blocklist = BKTree()
+        for hash_file in hash_files:
+            for stored_hash in load_hashes(hash_file):
+                if stored_hash:
+                    self.blocklist.add(hash_to_int(stored_hash), stored_hash)
+
+        self.seen = BKTree()
+        # Hashes of accepted images still being written, by source
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def check(self, data: bytes, source: str = "") -> str | None:
+        """
+        Decide whether downloaded bytes should be saved.
+
+        Args:
+            data (bytes): The downloaded file contents.
+            source (str): Identifier recorded for accepted images, e.g. the
+                URL; also the key for commit and release.
+
+        Returns:
+            str | None: The reason to reject the image, or None to accept it.
+        """
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                img.verify()
+            with Image.open(io.BytesIO(data)) as img:
+                width, height = img.size
+                image_hash = HASH_ALGORITHMS[self.algorithm](img)
+        except Exception as e:
+            return f"corrupted: {e}"
+
+        if min(width, height) < self.min_size:
+            return f"too small ({width}x{height})"
+
+        value = hash_to_int(image_hash)
+        with self.lock:
+            if self.blocklist.contains_near(value, self.threshold):
+                return "blocklisted"
+            duplicate = self.seen.search(value, self.threshold)
+            if duplicate:
+                return f"duplicate of {duplicate[0][1]}"
+            # In-flight images count too, so two threads never save one picture
+            for pending_source, pending_value in self.pending.items():
+                if hamming_distance(value, pending_value) <= self.threshold:
+                    return f"duplicate of {pending_source}"
+            self.pending[source] = value
+
+        return None
+
+    def commit(self, source: str) -> None:
+        """
+        Record an image accepted by check as saved.
+        """
+        with self.lock:
+            self.seen.add(self.pending.pop(source), source)
+
+    def release(self, source: str) -> None:
+        """
+        Forget an image accepted by check that could not be saved.
+        """
+        with self.lock:
+            self.pending.pop(source, None)
 
 
 if __name__ == "__main__":
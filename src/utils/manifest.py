@@ -0,0 +1,147 @@
+import hashlib
+import os
+import sqlite3
+
+
+def hash_file(file_path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    Compute the BLAKE2b content hash of a file.
+
+    Args:
+        file_path (str): Path to the file.
+        chunk_size (int): Number of bytes read per iteration.
+
+    Returns:
+        str: Hex digest of the file contents.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Manifest:
+    """
+    Persistent record of the inputs and outputs of each pipeline stage.
+
+    Every entry stores the input hash, size, mtime and output path, so a
+    re-run can skip any file whose input is unchanged and whose output
+    still exists. Size and mtime are checked first; the input is only
+    re-hashed when they differ, so touched-but-identical files are still
+    recognised as up to date.
+
+    The connection is not shared across threads: query and record from the
+    thread that created the manifest.
+    """
+
+    def __init__(self, db_path: str) -> None:
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                stage TEXT NOT NULL,
+                input_path TEXT NOT NULL,
+                input_hash TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                output_path TEXT NOT NULL,
+                PRIMARY KEY (stage, input_path)
+            )
+            """
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS entries_output ON entries (output_path)"
+        )
+        self.connection.commit()
+
+    def __enter__(self) -> "Manifest":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.connection.commit()
+        self.connection.close()
+
+    def is_up_to_date(self, stage: str, input_path: str, output_path: str) -> bool:
+        """
+        Check whether a stage output is still valid for its input.
+
+        Args:
+            stage (str): Name of the pipeline stage.
+            input_path (str): Path to the stage input.
+            output_path (str): Path the stage writes to.
+
+        Returns:
+            bool: True if the recorded input matches and the output exists.
+        """
+        row = self.connection.execute(
+            "SELECT input_hash, size, mtime_ns, output_path FROM entries "
+            "WHERE stage = ? AND input_path = ?",
+            (stage, input_path),
+        ).fetchone()
+        if row is None:
+            return False
+
+        input_hash, size, mtime_ns, recorded_output = row
+        if recorded_output != output_path or not os.path.exists(output_path):
+            return False
+
+        try:
+            stat = os.stat(input_path)
+        except FileNotFoundError:
+            return False
+
+        if stat.st_size == size and stat.st_mtime_ns == mtime_ns:
+            return True
+        if stat.st_size != size or hash_file(input_path) != input_hash:
+            return False
+
+        # Same content with a new mtime: refresh the entry so the next check is cheap
+        self.connection.execute(
+            "UPDATE entries SET mtime_ns = ? WHERE stage = ? AND input_path = ?",
+            (stat.st_mtime_ns, stage, input_path),
+        )
+        return True
+
+    def record(self, stage: str, input_path: str, output_path: str) -> None:
+        """
+        Record that a stage produced output_path from input_path.
+
+        Stages can write the same path in different ways, e.g. a full-size
+        and a fused 224x224 conversion. Entries of other stages or inputs for
+        output_path are dropped, so they no longer count as up to date once
+        their output has been overwritten.
+
+        Args:
+            stage (str): Name of the pipeline stage.
+            input_path (str): Path to the stage input.
+            output_path (str): Path the stage wrote to.
+        """
+        stat = os.stat(input_path)
+        self.connection.execute(
+            "DELETE FROM entries WHERE output_path = ? "
+            "AND NOT (stage = ? AND input_path = ?)",
+            (output_path, stage, input_path),
+        )
+        self.connection.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                stage,
+                input_path,
+                hash_file(input_path),
+                stat.st_size,
+                stat.st_mtime_ns,
+                output_path,
+            ),
+        )
+
+    def commit(self) -> None:
+        self.connection.commit()
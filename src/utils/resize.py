@@ -0,0 +1,91 @@
+from PIL import Image
+
+# In fast mode the JPEG decoder is asked for at least this multiple of the
+# target size, so the final LANCZOS pass still has pixels to antialias from
+DRAFT_OVERSAMPLE = 2
+
+# Passed to Image.resize in fast mode: shrink by whole factors with a box
+# filter first while the image is over this many times the target size
+REDUCING_GAP = 3.0
+
+
+def resize_and_crop(
+    img: Image.Image, target_size: int = 256, crop_size: int = 224, fast: bool = False
+) -> Image.Image:
+    """
+    Resize an image to the target size and then crop the center to the crop size.
+
+    Args:
+        img (Image.Image): Image to transform.
+        target_size (int): Size to resize the image to (default is 256x256).
+        crop_size (int): Size to crop the center of the image (default is 224x224).
+        fast (bool): Decode JPEGs in draft mode, downscaling by 1/2, 1/4 or 1/8
+            in the DCT domain, then reduce and LANCZOS-resize the rest of the
+            way. Must be called before the image data is loaded to have an
+            effect; other formats only get the reduce step.
+
+    Returns:
+        Image.Image: The resized and cropped image.
+    """
+    if fast:
+        draft_size = target_size * DRAFT_OVERSAMPLE
+        img.draft(img.mode, (draft_size, draft_size))
+        img = img.resize(
+            (target_size, target_size), Image.LANCZOS, reducing_gap=REDUCING_GAP
+        )
+    else:
+        img = img.resize((target_size, target_size), Image.LANCZOS)
+
+    return center_crop(img, target_size, crop_size)
+
+
+def center_crop(img: Image.Image, target_size: int, crop_size: int) -> Image.Image:
+    # Whole-pixel offsets, so odd margins still give exactly crop_size pixels
+    left = (target_size - crop_size) // 2
+    top = (target_size - crop_size) // 2
+    right = left + crop_size
+    bottom = top + crop_size
+
+    return img.crop((left, top, right, bottom))
+
+
+def pyramid_target_size(crop_size: int) -> int:
+    """
+    Resize size for a crop size, keeping the 256/224 ratio of the default level.
+    """
+    return round(crop_size * 256 / 224)
+
+
+def resize_pyramid(
+    img: Image.Image, levels: list[tuple[int, int]], fast: bool = False
+) -> list[Image.Image]:
+    """
+    Produce several resized and cropped versions of an image from one decode.
+
+    Levels are computed from the largest down, each resized from the previous
+    level's uncropped image rather than from the original, so every level
+    after the first costs a resize of an already small image.
+
+    Args:
+        img (Image.Image): Image to transform, ideally not loaded yet.
+        levels (list): (target_size, crop_size) pairs, in any order.
+        fast (bool): Use draft-mode decoding for the largest level (see
+            resize_and_crop).
+
+    Returns:
+        list: The cropped images, in the order of levels.
+    """
+    if fast:
+        draft_size = max(target for target, _ in levels) * DRAFT_OVERSAMPLE
+        img.draft(img.mode, (draft_size, draft_size))
+
+    crops = {}
+    for target_size, crop_size in sorted(set(levels), reverse=True):
+        img = img.resize(
+            (target_size, target_size),
+            Image.LANCZOS,
+            reducing_gap=REDUCING_GAP if fast else None,
+        )
+        crops[target_size, crop_size] = center_crop(img, target_size, crop_size)
+
+    return [crops[level] for level in levels]
@@ -0,0 +1,133 @@
+import json
+import os
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+from utils.formats import load_image
+
+IMAGE_EXTENSIONS = (".jpeg", ".jpg", ".png", ".webp", ".npy")
+
+
+def list_image_folder(split_dir: str) -> tuple[list[str], list[tuple[str, int]]]:
+    """
+    List images laid out as split_dir/<class>/<image>, like ImageFolder.
+
+    Args:
+        split_dir (str): Path to the split directory.
+
+    Returns:
+        tuple: (sorted class names, sorted list of (image path, class index)).
+    """
+    classes = sorted(entry.name for entry in os.scandir(split_dir) if entry.is_dir())
+    samples = []
+    for class_index, class_name in enumerate(classes):
+        class_dir = os.path.join(split_dir, class_name)
+        for filename in sorted(os.listdir(class_dir)):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                samples.append((os.path.join(class_dir, filename), class_index))
+    return classes, samples
+
+
+def write_shard(
+    split_dir: str, output_dir: str, size: int = 224, grayscale: bool = True
+) -> None:
+    """
+    Pack a split into one contiguous uint8 image array plus labels and index.
+
+    Writes images.npy (N x size x size, or N x size x size x 3), labels.npy
+    and index.json to output_dir. The image array is filled through a
+    memmap, so the whole split never has to fit in memory.
+
+    Every file is written under a temporary name and moved into place at the
+    end, index.json last, since the loader only uses shards that have one.
+    An interrupted write leaves either the previous shard or no shard.
+
+    Args:
+        split_dir (str): Path to the split directory (class subfolders).
+        output_dir (str): Path to the directory to write the shard to.
+        size (int): Expected width and height of every image.
+        grayscale (bool): Store single-channel images instead of RGB.
+    """
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    classes, samples = list_image_folder(split_dir)
+    mode = "L" if grayscale else "RGB"
+    shape = (len(samples), size, size) if grayscale else (len(samples), size, size, 3)
+
+    files = {
+        name: os.path.join(output_dir, name)
+        for name in ("images.npy", "labels.npy", "index.json")
+    }
+    tmp_files = {name: path + ".tmp" for name, path in files.items()}
+
+    images = np.lib.format.open_memmap(
+        tmp_files["images.npy"], mode="w+", dtype=np.uint8, shape=shape
+    )
+    for i, (image_path, _) in enumerate(samples):
+        with load_image(image_path) as img:
+            if img.size != (size, size):
+                width, height = img.size
+                raise ValueError(
+                    f"{image_path} is {width}x{height}, expected {size}x{size}"
+                )
+            images[i] = np.asarray(img.convert(mode))
+    images.flush()
+    del images
+
+    labels = np.array([label for _, label in samples], dtype=np.int64)
+    with open(tmp_files["labels.npy"], "wb") as f:
+        np.save(f, labels)
+
+    index = {
+        "classes": classes,
+        "files": [os.path.relpath(path, split_dir) for path, _ in samples],
+        "shape": list(shape),
+        "mode": mode,
+    }
+    with open(tmp_files["index.json"], "w") as f:
+        json.dump(index, f)
+
+    # Retire the old index first, so a shard is never half old and half new
+    if os.path.exists(files["index.json"]):
+        os.remove(files["index.json"])
+    for name, path in files.items():
+        os.replace(tmp_files[name], path)
+
+    print(f"Wrote {len(samples)} images from {split_dir} to {output_dir}")
+
+
+class ShardDataset(Dataset):
+    """
+    Dataset over a shard written by write_shard.
+
+    Images are served as zero-copy uint8 CHW views of the memory-mapped
+    array; pass a transform to convert them, e.g. to float in [0, 1].
+    """
+
+    def __init__(self, shard_dir: str, transform=None) -> None:
+        # Copy-on-write mapping: pages stay shared with the file, yet the
+        # arrays are writable so torch.from_numpy does not warn
+        self.images = np.load(os.path.join(shard_dir, "images.npy"), mmap_mode="c")
+        self.labels = np.load(os.path.join(shard_dir, "labels.npy"))
+        with open(os.path.join(shard_dir, "index.json"), "r") as f:
+            index = json.load(f)
+
+        self.classes = index["classes"]
+        self.files = index["files"]
+        self.targets = self.labels.tolist()
+        self.transform = transform
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def __getitem__(self, idx: int) -> tuple[torch.Tensor, int]:
+        image = torch.from_numpy(self.images[idx])
+        if image.ndim == 2:
+            image = image.unsqueeze(0)
+        else:
+            image = image.permute(2, 0, 1)
+
+        if self.transform is not None:
+            image = self.transform(image)
+        return image, self.targets[idx]
@@ -0,0 +1,141 @@
+import hashlib
+import os
+import random
+import pandas as pd
+
+CLASS_NAMES = {0: "normal", 1: "pneumonia"}
+SPLIT_MANIFEST_COLUMNS = ["file", "split", "class_name", "source"]
+
+
+def split_key(key: str, seed: int) -> int:
+    """
+    Stable pseudo-random rank of a key under a seed.
+
+    The rank depends only on the key and the seed, never on listing order,
+    on other keys or on any shared RNG state, so each worker or machine can
+    rank its own files and all of them agree on the result.
+
+    Args:
+        key (str): File name or patient ID.
+        seed (int): Seed of the split.
+
+    Returns:
+        int: A 64-bit rank; lower ranks are selected first.
+    """
+    digest = hashlib.blake2b(f"{seed}:{key}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def sample_keys(keys, num: int, seed: int | None = None) -> list[str]:
+    """
+    Pick num keys at random, reproducibly for a given seed.
+
+    Keys are ordered by split_key, so with the same seed a larger sample
+    always extends a smaller one, and sampling again from the remainder
+    continues where the previous sample stopped.
+
+    Args:
+        keys (iterable): Keys to sample from, in any order.
+        num (int): Number of keys to pick (capped at the number of keys).
+        seed (int, optional): Seed of the split; a fresh random seed when None.
+
+    Returns:
+        list: The selected keys, lowest rank first.
+    """
+    if seed is None:
+        seed = random.SystemRandom().getrandbits(64)
+    return sorted(keys, key=lambda key: (split_key(key, seed), key))[:num]
+
+
+def load_rsna_labels(csv_file: str) -> dict[str, int]:
+    """
+    Load one label per patient from the RSNA label CSV.
+
+    The CSV has one row per bounding box, so patients with several boxes
+    appear several times; they are collapsed to a single entry.
+
+    Args:
+        csv_file (str): Path to the CSV file containing patientId and Target columns.
+
+    Returns:
+        dict: Mapping of patient ID to target (1 for pneumonia, 0 for normal).
+    """
+    df = pd.read_csv(csv_file, usecols=["patientId", "Target"])
+    return df.groupby("patientId")["Target"].max().astype(int).to_dict()
+
+
+def plan_rsna_split(
+    labels: dict[str, int],
+    seed: int,
+    train_count: int = 1300,
+    test_count: int = 370,
+) -> dict[str, tuple[str, str, str]]:
+    """
+    Choose the RSNA patients that go into each split before any image work.
+
+    Each patient is first given the name sort_and_rename_files gives its
+    image, its position in its sorted class as NNNN.jpeg. Those names are
+    ranked with sample_keys; the first train_count go to train and the next
+    test_count to test. This is exactly what the sequential move_random_files
+    calls pick from the renamed directories, so both paths build the same
+    split for a seed.
+
+    Args:
+        labels (dict): Mapping of patient ID to target.
+        seed (int): Seed of the split.
+        train_count (int): Number of train images per class.
+        test_count (int): Number of test images per class.
+
+    Returns:
+        dict: Mapping of selected patient ID to (split, class name, file name).
+    """
+    plan = {}
+
+    for target, class_name in CLASS_NAMES.items():
+        # Sorted by file name, as sort_and_rename_files sorts the images
+        patients = sorted(
+            (pid for pid, label in labels.items() if label == target),
+            key=lambda pid: f"{pid}.jpeg",
+        )
+        names = {f"{i:04d}.jpeg": pid for i, pid in enumerate(patients, start=1)}
+        chosen = sample_keys(names, train_count + test_count, seed)
+
+        for i, name in enumerate(chosen):
+            split = "train" if i < train_count else "test"
+            plan[names[name]] = (split, class_name, f"rsna_{name}")
+
+    return plan
+
+
+def write_split_manifest(
+    entries: list[tuple[str, str, str, str]], manifest_file: str
+) -> None:
+    """
+    Save the outcome of a split so later stages need not rescan directories.
+
+    Args:
+        entries (list): (file, split, class_name, source) rows, where file is
+            relative to the manifest's directory and source is the original
+            input the file came from.
+        manifest_file (str): Path to the CSV to write.
+    """
+    df = pd.DataFrame(sorted(entries), columns=SPLIT_MANIFEST_COLUMNS)
+    df.to_csv(manifest_file + ".tmp", index=False)
+    os.replace(manifest_file + ".tmp", manifest_file)
+    print(f"Wrote split manifest with {len(df)} files to {manifest_file}")
+
+
+def read_split_manifest(manifest_file: str) -> pd.DataFrame:
+    """
+    Load a split manifest written by write_split_manifest.
+
+    Args:
+        manifest_file (str): Path to the manifest CSV.
+
+    Returns:
+        pd.DataFrame: One row per file, with file paths made absolute.
+    """
+    df = pd.read_csv(manifest_file, dtype=str)
+    root = os.path.dirname(os.path.abspath(manifest_file))
+    df["file"] = [os.path.join(root, file) for file in df["file"]]
+    return df